@@ -1,12 +1,51 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import requests
-import concurrent.futures
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Optional, List, Dict
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, field_validator
+import argparse
+import asyncio
+import hashlib
+import heapq
+import importlib.util
+import json
+import logging
+import math
+import os
+import random
+import re
+import sqlite3
+import string
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Deque, Tuple, Type, Literal, AsyncIterator, Iterator, Set
+import httpx
+
+# orjson is optional and only makes parsing replies faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled upstream client per process, shared by every request
+    get_http_client()
+    await job_runner.start()
+    try:
+        yield
+    finally:
+        await job_runner.stop()
+        await close_http_client()
+        rubric_cache.close()
+        topic_index.close()
 
-app = FastAPI(title="AP QC API")
+app = FastAPI(title="AP QC API", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -30,8 +69,8 @@ JSON_RESPONSE_SCHEMA = """{
 JSON_RESPONSE_SCHEMA_2 = """{
         "score": 0 or 1,
         "rationale": "Your 2-line explanation here",
-        "ek_aligned": "the ek code that is aligned to the text"
-        "lo_aligned": "the lo code that is aligned to the text"
+        "ek_aligned": "the ek code that is aligned to the text",
+        "lo_aligned": "the lo code that is aligned to the text",
         "skill_aligned": "the skill code that is aligned to the text"
     }"""
 
@@ -116,9 +155,43 @@ SKILL_DESCRIPTION = """[
     {'code': '6', 'skill': 'Argumentation', 'description': 'Develop and support a historical argument.'}
 ]"""
 
+# Static reference material shared by every rubric and question
+REFERENCE_BLOCK = f"""You are reviewing multiple choice questions written for AP learning materials. Each request applies one rubric to the question under evaluation, using the reference material and context below.
+
+    AP Skills:  #### {SKILL_DESCRIPTION} ####
+    BLOOM_EASY, Bloom's (Remembering, Understanding), DOK (1-2):  #### {BLOOM_EASY} ####
+    BLOOM_MODERATE, Bloom's (Applying, Analyzing), DOK (3):  #### {BLOOM_MODERATE} ####
+    BLOOM_DIFFICULT, Bloom's (Evaluating, Creating), DOK (4):  #### {BLOOM_DIFFICULT} ####
+    ABSOLUTES:  #### {ABSOLUTES} ####
+    PATTERN_PHRASES:  #### {PATTERN_PHRASES} ####"""
+
 
 # API Configuration
-API_URL = "https://api.anthropic.com/v1/messages"
+API_URL = os.environ.get("QC_API_URL", "https://api.anthropic.com/v1/messages")
+BATCH_API_URL = API_URL + "/batches"
+
+def set_api_url(url: str) -> None:
+    # Points every upstream call (e.g. at a local mock) without touching the env
+    global API_URL, BATCH_API_URL
+    API_URL = url
+    BATCH_API_URL = url + "/batches"
+
+MODEL = "claude-3-7-sonnet-20250219"
+MAX_TOKENS = 8192
+TEMPERATURE = 0.2
+# "llm" sends every rubric upstream, "rules" only runs the local checkers and
+# "hybrid" lets the local checkers settle what they can before calling upstream
+CheckMode = Literal["llm", "rules", "hybrid"]
+CHECK_MODE: CheckMode = os.environ.get("QC_CHECK_MODE", "llm")
+# Rubrics sharing inputs can go upstream as one consolidated call, written as
+# groups separated by ";" e.g. "prompt7,prompt9,prompt10;prompt3,prompt4".
+# Empty keeps one call per rubric.
+RUBRIC_GROUPS = os.environ.get("QC_RUBRIC_GROUPS", "")
+# Skip rubrics whose gates (clarity and format) scored 0
+GATING = os.environ.get("QC_GATING", "0") == "1"
+# Run one rubric before the rest so it writes the shared prefix to the upstream
+# prompt cache and the others read it instead of each writing their own copy
+PROMPT_CACHE_WARMUP = os.environ.get("QC_PROMPT_CACHE_WARMUP", "0") == "1"
 API_KEY = ""
 HEADERS = {
     "x-api-key": API_KEY,
@@ -126,6 +199,742 @@ HEADERS = {
     "content-type": "application/json"
 }
 
+# HTTP client configuration
+HTTP_MAX_CONNECTIONS = int(os.environ.get("QC_HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("QC_HTTP_MAX_KEEPALIVE", "50"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("QC_HTTP_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.environ.get("QC_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.environ.get("QC_READ_TIMEOUT", "120"))
+# HTTP/2 multiplexing is used when the optional h2 package is installed
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    # A transport (e.g. httpx.MockTransport) can stand in for upstream locally
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            transport=transport,
+            headers=HEADERS,
+            http2=HTTP2_ENABLED,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT, pool=None),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return http_client
+
+async def close_http_client() -> None:
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+# Observability: Prometheus metrics and structured JSON logs
+LOG_LEVEL = os.environ.get("QC_LOG_LEVEL", "INFO").upper()
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+PARSE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+
+current_trace_id: ContextVar[Optional[str]] = ContextVar("current_trace_id", default=None)
+current_rubric: ContextVar[str] = ContextVar("current_rubric", default="")
+
+class Metric:
+    def __init__(self, name: str, help: str, kind: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+        METRICS.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{label}="{escape_label(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{self._format_labels(key)} {value:g}")
+        return lines
+
+class Histogram(Metric):
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, "histogram", labels)
+        self.buckets = buckets
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        # Per series: one count per bucket, then +Inf count and sum
+        series = self.series.setdefault(self._key(labels), [0.0] * (len(self.buckets) + 2))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self.series.items():
+            bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, series):
+                le = 'le="' + bound + '"'
+                lines.append(f"{self.name}_bucket{self._format_labels(key, le)} {count:g}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {series[-1]:g}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {series[-2]:g}")
+        return lines
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+METRICS: List[Metric] = []
+
+QUEUE_WAIT_SECONDS = Histogram("qc_upstream_queue_wait_seconds", "Time rubric calls wait for the scheduler",
+                               ("rubric", "model"))
+UPSTREAM_LATENCY_SECONDS = Histogram("qc_upstream_latency_seconds", "Upstream call latency",
+                                     ("rubric", "model", "status"))
+PARSE_SECONDS = Histogram("qc_parse_seconds", "Time spent parsing rubric responses", ("rubric",), PARSE_BUCKETS)
+QUESTION_SECONDS = Histogram("qc_question_seconds", "End to end time to analyse a question", ("mode",))
+UPSTREAM_REQUESTS = Metric("qc_upstream_requests_total", "Upstream calls by response status", "counter",
+                           ("rubric", "model", "status"))
+UPSTREAM_IN_FLIGHT = Metric("qc_upstream_in_flight", "Upstream calls currently in flight", "gauge")
+UPSTREAM_RETRIES = Metric("qc_upstream_retries_total", "Upstream calls retried after a failure", "counter",
+                          ("rubric", "model"))
+UPSTREAM_HEDGES = Metric("qc_upstream_hedges_total", "Duplicate calls sent to cut tail latency", "counter",
+                         ("rubric", "model"))
+TOKENS = Metric("qc_tokens_total", "Tokens reported by upstream usage", "counter", ("rubric", "model", "kind"))
+PARSE_FAILURES = Metric("qc_parse_failures_total", "Rubric responses that could not be parsed", "counter",
+                        ("rubric",))
+PARSE_REPAIRS = Metric("qc_parse_repairs_total", "Rubric responses that parsed only after repair", "counter",
+                       ("rubric",))
+PARSE_REASKS = Metric("qc_parse_reasks_total", "Rubrics re-asked after an unparseable response", "counter",
+                      ("rubric", "outcome"))
+RESULT_CACHE = Metric("qc_result_cache_total", "Rubric result cache lookups", "counter", ("rubric", "outcome"))
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "event": record.getMessage(),
+            "trace_id": current_trace_id.get(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+logger = logging.getLogger("ap_mcq_qc")
+if not logger.handlers:
+    log_handler = logging.StreamHandler()
+    log_handler.setFormatter(JsonLogFormatter())
+    logger.addHandler(log_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+def log_event(level: int, event: str, **fields) -> None:
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+# Scheduler configuration
+SCHEDULER_MAX_CONCURRENCY = int(os.environ.get("QC_MAX_CONCURRENCY", "50"))
+SCHEDULER_REQUESTS_PER_MINUTE = float(os.environ.get("QC_REQUESTS_PER_MINUTE", "1000"))
+SCHEDULER_TOKENS_PER_MINUTE = float(os.environ.get("QC_TOKENS_PER_MINUTE", "200000"))
+
+# Rubric calls are queued per lane and lanes are served round-robin, so a
+# large batch shares capacity evenly with interactive single-question calls
+current_lane: ContextVar[str] = ContextVar("current_lane", default="default")
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        self._refill()
+        # Requests larger than the bucket go through once it is full
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def set_limit(self, per_minute: float) -> None:
+        if per_minute > 0 and per_minute != self.capacity:
+            self._refill()
+            self.capacity = per_minute
+            self.rate = per_minute / 60.0
+            self.level = min(self.level, per_minute)
+
+    def observe_remaining(self, remaining: float) -> None:
+        self._refill()
+        self.level = min(self.level, remaining)
+
+class RateLimitScheduler:
+    def __init__(self, max_concurrency: int, requests_per_minute: float, tokens_per_minute: float):
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self.lanes: "OrderedDict[str, Deque[Tuple[asyncio.Future, int]]]" = OrderedDict()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+    @asynccontextmanager
+    async def slot(self, lane: str, tokens: int):
+        await self.acquire(lane, tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, lane: str, tokens: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self.lanes.setdefault(lane, deque()).append((future, tokens))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Granted just before the caller was cancelled: hand the slot back
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.lanes and self.in_flight < self.max_concurrency:
+            lane, waiters = next(iter(self.lanes.items()))
+            future, tokens = waiters[0]
+            if future.done():
+                # Caller was cancelled while waiting
+                waiters.popleft()
+                if not waiters:
+                    del self.lanes[lane]
+                continue
+
+            delay = max(self.paused_until - time.monotonic(),
+                        self.requests.delay(1),
+                        self.tokens.delay(tokens))
+            if delay > 0:
+                self._schedule_wakeup(delay)
+                return
+
+            waiters.popleft()
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+            if waiters:
+                self.lanes.move_to_end(lane)
+            else:
+                del self.lanes[lane]
+
+    def _schedule_wakeup(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._wakeup is not None:
+            if self._wakeup.when() <= when:
+                return
+            self._wakeup.cancel()
+        self._wakeup = loop.call_at(when, self._on_wakeup)
+
+    def _on_wakeup(self) -> None:
+        self._wakeup = None
+        self._dispatch()
+
+    def settle(self, estimated: int, actual: Optional[int]) -> None:
+        # Refund (or charge) the difference between the estimate and real usage
+        if actual is not None:
+            self.tokens.take(actual - estimated)
+
+    def observe(self, response: httpx.Response) -> None:
+        headers = response.headers
+
+        requests_limit = headers.get("anthropic-ratelimit-requests-limit")
+        requests_remaining = headers.get("anthropic-ratelimit-requests-remaining")
+        tokens_limit = (headers.get("anthropic-ratelimit-input-tokens-limit")
+                        or headers.get("anthropic-ratelimit-tokens-limit"))
+        tokens_remaining = (headers.get("anthropic-ratelimit-input-tokens-remaining")
+                            or headers.get("anthropic-ratelimit-tokens-remaining"))
+
+        try:
+            if requests_limit:
+                self.requests.set_limit(float(requests_limit))
+            if requests_remaining:
+                self.requests.observe_remaining(float(requests_remaining))
+            if tokens_limit:
+                self.tokens.set_limit(float(tokens_limit))
+            if tokens_remaining:
+                self.tokens.observe_remaining(float(tokens_remaining))
+        except ValueError:
+            pass
+
+        if response.status_code in (429, 529):
+            retry_after = parse_retry_after(headers.get("retry-after"))
+            if retry_after is None:
+                retry_after = 1.0
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+        self._dispatch()
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+def estimate_tokens(payload: dict) -> int:
+    # Roughly four characters per token is enough for admission control
+    return len(json.dumps(payload)) // 4
+
+scheduler = RateLimitScheduler(SCHEDULER_MAX_CONCURRENCY,
+                               SCHEDULER_REQUESTS_PER_MINUTE,
+                               SCHEDULER_TOKENS_PER_MINUTE)
+
+# Retry configuration
+QUESTION_DEADLINE = float(os.environ.get("QC_QUESTION_DEADLINE", "300"))
+MAX_ATTEMPTS = int(os.environ.get("QC_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE = float(os.environ.get("QC_BACKOFF_BASE", "1"))
+BACKOFF_MAX = float(os.environ.get("QC_BACKOFF_MAX", "30"))
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504, 529}
+# Hedging sends a duplicate call once the first has run longer than the
+# recent p95 latency, and keeps whichever answers first
+HEDGE_ENABLED = os.environ.get("QC_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = float(os.environ.get("QC_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("QC_HEDGE_MIN_SAMPLES", "20"))
+
+class UpstreamError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code in RETRYABLE_STATUS_CODES
+
+class LatencyTracker:
+    def __init__(self, window: int = 500):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+latency_tracker = LatencyTracker()
+
+def backoff_delay(attempt: int, retry_after: Optional[float]) -> float:
+    # Full jitter, but never sooner than upstream asked us to wait
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+    return max(delay, retry_after or 0.0)
+
+# Cache configuration (an empty QC_CACHE_PATH keeps the cache in memory only)
+CACHE_PATH = os.environ.get("QC_CACHE_PATH", "qc_cache.sqlite3")
+CACHE_MEMORY_ENTRIES = int(os.environ.get("QC_CACHE_MEMORY_ENTRIES", "2048"))
+CACHE_TTL_SECONDS = float(os.environ.get("QC_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_BYTES = int(os.environ.get("QC_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+class RubricCache:
+    # Bounded in-memory LRU in front of a SQLite store with TTL and size eviction
+    def __init__(self, path: str, memory_entries: int, ttl_seconds: float, max_bytes: int):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._db is None and self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS rubric_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL)""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS rubric_cache_created ON rubric_cache (created)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS rubric_cache_accessed ON rubric_cache (accessed)")
+            self._db.commit()
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key: str, value: str, created: float) -> None:
+        self.memory[key] = (value, created)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return None
+            row = db.execute("SELECT value, created FROM rubric_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.ttl_seconds < time.time():
+                db.execute("DELETE FROM rubric_cache WHERE key = ?", (key,))
+                db.commit()
+                return None
+            db.execute("UPDATE rubric_cache SET accessed = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+            return row[0], row[1]
+
+    def _disk_put(self, key: str, value: str, created: float) -> None:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return
+            size = len(value.encode("utf-8"))
+            db.execute("INSERT OR REPLACE INTO rubric_cache VALUES (?, ?, ?, ?, ?)",
+                       (key, value, size, created, created))
+            db.execute("DELETE FROM rubric_cache WHERE created < ?", (time.time() - self.ttl_seconds,))
+
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM rubric_cache").fetchone()[0]
+            if total > self.max_bytes:
+                evict = []
+                for old_key, old_size in db.execute("SELECT key, size FROM rubric_cache ORDER BY accessed"):
+                    if total <= self.max_bytes:
+                        break
+                    evict.append((old_key,))
+                    total -= old_size
+                db.executemany("DELETE FROM rubric_cache WHERE key = ?", evict)
+            db.commit()
+
+    def _disk_invalidate(self, keys: Optional[List[str]]) -> int:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return 0
+            if keys is None:
+                removed = db.execute("DELETE FROM rubric_cache").rowcount
+            else:
+                removed = db.executemany("DELETE FROM rubric_cache WHERE key = ?",
+                                         [(key,) for key in keys]).rowcount
+            db.commit()
+            return removed
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self.memory.get(key)
+        if entry is not None:
+            if entry[1] + self.ttl_seconds >= time.time():
+                self.memory.move_to_end(key)
+                return entry[0]
+            del self.memory[key]
+
+        try:
+            entry = await asyncio.to_thread(self._disk_get, key)
+        except sqlite3.Error as e:
+            log_event(logging.WARNING, "cache_read_failed", error=str(e))
+            return None
+        if entry is None:
+            return None
+        self._remember(key, *entry)
+        return entry[0]
+
+    async def put(self, key: str, value: str) -> None:
+        created = time.time()
+        self._remember(key, value, created)
+        try:
+            await asyncio.to_thread(self._disk_put, key, value, created)
+        except sqlite3.Error as e:
+            log_event(logging.WARNING, "cache_write_failed", error=str(e))
+
+    async def invalidate(self, keys: Optional[List[str]] = None) -> int:
+        if keys is None:
+            removed = len(self.memory)
+            self.memory.clear()
+        else:
+            removed = sum(self.memory.pop(key, None) is not None for key in keys)
+        disk_removed = await asyncio.to_thread(self._disk_invalidate, keys)
+        return max(removed, disk_removed)
+
+rubric_cache = RubricCache(CACHE_PATH, CACHE_MEMORY_ENTRIES, CACHE_TTL_SECONDS, CACHE_MAX_BYTES)
+
+# Near-duplicate index for the topic questions check (an empty
+# QC_TOPIC_INDEX_PATH keeps the index in memory only)
+TOPIC_INDEX_PATH = os.environ.get("QC_TOPIC_INDEX_PATH", "topic_index.sqlite3")
+# Questions with a topic only show the LLM this many nearest topic questions
+TOPIC_TOP_K = int(os.environ.get("QC_TOPIC_TOP_K", "5"))
+# Candidates below this cosine similarity are not worth the LLM's attention
+TOPIC_MIN_SIMILARITY = float(os.environ.get("QC_TOPIC_MIN_SIMILARITY", "0.1"))
+
+TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+def question_terms(text: str) -> Dict[str, int]:
+    # Words and word pairs, so reworded copies still share most terms
+    words = TERM_PATTERN.findall(text.lower())
+    counts: Dict[str, int] = {}
+    for term in words + [f"{first} {second}" for first, second in zip(words, words[1:])]:
+        counts[term] = counts.get(term, 0) + 1
+    return counts
+
+def question_key(text: str) -> str:
+    return hashlib.sha256(" ".join(TERM_PATTERN.findall(text.lower())).encode("utf-8")).hexdigest()
+
+def split_topic_questions(text: str) -> List[str]:
+    # Questions are separated by blank lines, or one per line when there are none
+    blocks = re.split(r"\n\s*\n", text.strip())
+    if len(blocks) == 1:
+        blocks = text.splitlines()
+    return [block.strip() for block in blocks if block.strip()]
+
+class TopicBank:
+    # TF-IDF vectors of one topic's questions behind an inverted index, so a
+    # lookup only touches questions sharing a term with the query
+    def __init__(self):
+        self.texts: Dict[str, str] = {}
+        self.terms: Dict[str, Dict[str, int]] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.idf: Optional[Dict[str, float]] = None
+        self.norms: Dict[str, float] = {}
+
+    def add(self, key: str, text: str) -> bool:
+        if key in self.texts:
+            return False
+        terms = question_terms(text)
+        self.texts[key] = text
+        self.terms[key] = terms
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[key] = count
+        # Document frequencies moved, weights are recomputed on the next lookup
+        self.idf = None
+        return True
+
+    def _reweight(self) -> None:
+        total = len(self.texts)
+        self.idf = {term: math.log((1 + total) / (1 + len(keys))) + 1 for term, keys in self.postings.items()}
+        self.norms = {key: math.sqrt(sum(((1 + math.log(count)) * self.idf[term]) ** 2
+                                         for term, count in terms.items()))
+                      for key, terms in self.terms.items()}
+
+    def nearest(self, text: str, k: int) -> List[Tuple[str, float]]:
+        if not self.texts or k <= 0:
+            return []
+        if self.idf is None:
+            self._reweight()
+        unseen_idf = math.log(1 + len(self.texts)) + 1
+        query = {term: (1 + math.log(count)) * self.idf.get(term, unseen_idf)
+                 for term, count in question_terms(text).items()}
+        query_norm = math.sqrt(sum(weight ** 2 for weight in query.values()))
+        if not query_norm:
+            return []
+
+        scores: Dict[str, float] = {}
+        for term, weight in query.items():
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for key, count in self.postings[term].items():
+                scores[key] = scores.get(key, 0.0) + weight * (1 + math.log(count)) * idf
+        best = heapq.nlargest(k, ((key, score / self.norms[key]) for key, score in scores.items()),
+                              key=lambda item: item[1])
+        return [(self.texts[key], score / query_norm) for key, score in best]
+
+class TopicIndex:
+    # Per-topic banks, loaded from SQLite on first use and extended as
+    # questions are accepted
+    def __init__(self, path: str):
+        self.path = path
+        self.banks: Dict[str, TopicBank] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._db is None and self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS topic_questions (
+                topic TEXT NOT NULL,
+                key TEXT NOT NULL,
+                text TEXT NOT NULL,
+                added REAL NOT NULL,
+                PRIMARY KEY (topic, key))""")
+            self._db.commit()
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _bank(self, topic: str) -> TopicBank:
+        bank = self.banks.get(topic)
+        if bank is None:
+            bank = TopicBank()
+            db = self._connect()
+            if db is not None:
+                for key, text in db.execute("SELECT key, text FROM topic_questions WHERE topic = ? ORDER BY added",
+                                            (topic,)):
+                    bank.add(key, text)
+            self.banks[topic] = bank
+        return bank
+
+    def _add(self, topic: str, texts: List[str]) -> Tuple[int, int]:
+        with self._lock:
+            bank = self._bank(topic)
+            added = [(topic, key, text, time.time()) for key, text in
+                     ((question_key(text), text) for text in texts) if bank.add(key, text)]
+            db = self._connect()
+            if db is not None and added:
+                db.executemany("INSERT OR IGNORE INTO topic_questions VALUES (?, ?, ?, ?)", added)
+                db.commit()
+            return len(added), len(bank.texts)
+
+    def _nearest(self, topic: str, text: str, k: int) -> List[Tuple[str, float]]:
+        with self._lock:
+            return self._bank(topic).nearest(text, k)
+
+    async def add(self, topic: str, texts: List[str]) -> Tuple[int, int]:
+        # Returns how many questions were new and the size of the topic bank
+        try:
+            return await asyncio.to_thread(self._add, topic, texts)
+        except sqlite3.Error as e:
+            log_event(logging.WARNING, "topic_index_write_failed", topic=topic, error=str(e))
+            return 0, len(self.banks.get(topic, TopicBank()).texts)
+
+    async def nearest(self, topic: str, text: str, k: int = TOPIC_TOP_K) -> List[dict]:
+        try:
+            found = await asyncio.to_thread(self._nearest, topic, text, k)
+        except sqlite3.Error as e:
+            log_event(logging.WARNING, "topic_index_read_failed", topic=topic, error=str(e))
+            return []
+        return [{"question": question, "similarity": round(similarity, 4)} for question, similarity in found]
+
+topic_index = TopicIndex(TOPIC_INDEX_PATH)
+
+# Article passage retrieval: with a token budget, long articles are cut down
+# to the passages that best match the question (0 sends the whole article)
+ARTICLE_TOKEN_BUDGET = int(os.environ.get("QC_ARTICLE_TOKEN_BUDGET", "0"))
+ARTICLE_CHUNK_TOKENS = int(os.environ.get("QC_ARTICLE_CHUNK_TOKENS", "200"))
+ARTICLE_INDEX_ENTRIES = int(os.environ.get("QC_ARTICLE_INDEX_ENTRIES", "256"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+def text_tokens(text: str) -> int:
+    # Same four characters per token rule as admission control
+    return len(text) // 4
+
+def chunk_article(article: str, chunk_tokens: int) -> List[str]:
+    # Paragraphs, with long ones split on sentence boundaries
+    chunks = []
+    for paragraph in re.split(r"\n\s*\n", article):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        current = ""
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            if current and text_tokens(current) + text_tokens(sentence) > chunk_tokens:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            chunks.append(current)
+    return chunks
+
+class ArticleIndex:
+    # BM25 over one article's chunks
+    def __init__(self, article: str, chunk_tokens: int):
+        self.chunks = chunk_article(article, chunk_tokens)
+        self.tokens = [text_tokens(chunk) for chunk in self.chunks]
+        self.terms: List[Dict[str, int]] = []
+        document_frequency: Dict[str, int] = {}
+        for chunk in self.chunks:
+            counts: Dict[str, int] = {}
+            for word in TERM_PATTERN.findall(chunk.lower()):
+                counts[word] = counts.get(word, 0) + 1
+            self.terms.append(counts)
+            for word in counts:
+                document_frequency[word] = document_frequency.get(word, 0) + 1
+        total = len(self.chunks)
+        self.idf = {word: math.log(1 + (total - count + 0.5) / (count + 0.5))
+                    for word, count in document_frequency.items()}
+        self.lengths = [sum(counts.values()) for counts in self.terms]
+        self.average_length = (sum(self.lengths) / total if total else 0.0) or 1.0
+
+    def scores(self, query: str) -> List[float]:
+        words = set(TERM_PATTERN.findall(query.lower())).intersection(self.idf)
+        scores = []
+        for counts, length in zip(self.terms, self.lengths):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / self.average_length)
+            scores.append(sum(self.idf[word] * counts[word] * (BM25_K1 + 1) / (counts[word] + norm)
+                              for word in words if word in counts))
+        return scores
+
+    def select(self, query: str, budget: int) -> List[Tuple[int, float]]:
+        # Best passages that fit the budget, the best one always; article order
+        ranked = sorted(enumerate(self.scores(query)), key=lambda item: item[1], reverse=True)
+        chosen = []
+        used = 0
+        for index, score in ranked:
+            if chosen and used + self.tokens[index] > budget:
+                continue
+            chosen.append((index, score))
+            used += self.tokens[index]
+        return sorted(chosen)
+
+article_indexes: "OrderedDict[str, ArticleIndex]" = OrderedDict()
+
+def article_index(article: str) -> Tuple[str, ArticleIndex]:
+    # Many questions share one article, so its chunks are indexed once
+    digest = hashlib.sha256(article.encode("utf-8")).hexdigest()
+    index = article_indexes.get(digest)
+    if index is None:
+        index = ArticleIndex(article, ARTICLE_CHUNK_TOKENS)
+        article_indexes[digest] = index
+        while len(article_indexes) > ARTICLE_INDEX_ENTRIES:
+            article_indexes.popitem(last=False)
+    article_indexes.move_to_end(digest)
+    return digest, index
+
 # Request Models
 class QuestionData(BaseModel):
     article: str
@@ -140,51 +949,303 @@ class QuestionData(BaseModel):
     lo_description: str
     goodqs: str
     badqs: str
-
-def call_claude_api(prompt: str) -> Optional[str]:
-    payload = {
-        "model": "claude-3-7-sonnet-20250219",
-        "max_tokens": 8192,
-        "temperature": 0.2,
+    # Subset of rubrics to run, all of them when omitted
+    rubrics: Optional[List[str]] = None
+    # With a topic, topic_questions are added to that topic's index and only
+    # the nearest few are shown to the LLM
+    topic: Optional[str] = None
+
+    @field_validator("rubrics")
+    @classmethod
+    def check_rubrics(cls, rubrics: Optional[List[str]]) -> Optional[List[str]]:
+        if rubrics is not None:
+            unknown = [name for name in rubrics if name not in RUBRICS]
+            if unknown:
+                raise ValueError(f"Unknown rubric(s): {', '.join(unknown)}")
+            rubrics = list(dict.fromkeys(rubrics))
+        return rubrics
+
+class CacheInvalidation(BaseModel):
+    keys: Optional[List[str]] = None
+
+class TopicQuestions(BaseModel):
+    questions: List[str]
+
+# Rubric response models, one per response format
+class RubricScore(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    score: int
+    rationale: str
+
+    @field_validator("score")
+    @classmethod
+    def check_score(cls, score: int) -> int:
+        if score not in (0, 1):
+            raise ValueError("score must be 0 or 1")
+        return score
+
+class FeedbackScore(RubricScore):
+    feedback: str
+
+class AlignmentScore(RubricScore):
+    ek_aligned: str
+    lo_aligned: str
+    skill_aligned: str
+
+class DifficultyScore(RubricScore):
+    difficulty: str
+    questiontype: str
+
+@dataclass
+class RubricCall:
+    text: Optional[str]
+    cache_key: str
+    cache_hit: bool = False
+    attempts: int = 0
+    hedged: bool = False
+    error: Optional[str] = None
+    queue_seconds: float = 0.0
+    upstream_seconds: float = 0.0
+    usage: Dict[str, int] = field(default_factory=dict)
+    repaired: bool = False
+
+def build_payload(prompt: dict) -> dict:
+    return {
+        "model": MODEL,
+        "max_tokens": MAX_TOKENS,
+        "temperature": TEMPERATURE,
+        "system": prompt["system"],
         "messages": [
-            {"role": "user", "content": prompt}
+            {"role": "user", "content": prompt["content"]}
         ]
     }
 
+def cache_key(payload: dict, context: Optional[Dict[str, str]] = None) -> str:
+    # The payload holds the rendered prompt and every model parameter. Given the
+    # context fields a rubric reads, they stand in for the shared system prefix,
+    # so editing one field only invalidates the rubrics that use it
+    if context is not None:
+        payload = dict(payload, system={"reference": REFERENCE_BLOCK, **context})
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+async def send_request(payload: dict, call: RubricCall) -> dict:
+    # A single upstream attempt, admitted by the scheduler
+    rubric = current_rubric.get()
+    model = payload["model"]
+    estimated = estimate_tokens(payload)
+    queued = time.monotonic()
+    async with scheduler.slot(current_lane.get(), estimated):
+        started = time.monotonic()
+        call.queue_seconds += started - queued
+        QUEUE_WAIT_SECONDS.observe(started - queued, rubric=rubric, model=model)
+        UPSTREAM_IN_FLIGHT.inc()
+        status = "error"
+        try:
+            response = await get_http_client().post(API_URL, json=payload)
+            status = str(response.status_code)
+        except httpx.TimeoutException as e:
+            status = "timeout"
+            raise UpstreamError(f"Upstream timed out: {type(e).__name__}", 408) from e
+        except httpx.TransportError as e:
+            raise UpstreamError(f"Upstream connection failed: {str(e)}", 503) from e
+        except asyncio.CancelledError:
+            # A hedge loser or an abandoned question, not an upstream failure
+            status = "cancelled"
+            raise
+        finally:
+            UPSTREAM_IN_FLIGHT.dec()
+            latency = time.monotonic() - started
+            UPSTREAM_LATENCY_SECONDS.observe(latency, rubric=rubric, model=model, status=status)
+            UPSTREAM_REQUESTS.inc(rubric=rubric, model=model, status=status)
+        latency_tracker.record(latency)
+
+    scheduler.observe(response)
+    if response.status_code >= 400:
+        raise UpstreamError(f"Upstream returned {response.status_code}", response.status_code,
+                            parse_retry_after(response.headers.get("retry-after")))
+
+    body = response.json()
+    usage = body.get('usage', {})
+    scheduler.settle(estimated, usage.get('input_tokens', 0) + usage.get('cache_creation_input_tokens', 0))
+    call.upstream_seconds = latency
+    call.usage = {kind: count for kind, count in usage.items() if isinstance(count, int)}
+    for kind, count in call.usage.items():
+        TOKENS.inc(count, rubric=rubric, model=model, kind=kind)
+    log_event(logging.DEBUG, "upstream_call", rubric=rubric, model=model, status=status,
+              queue_ms=round((started - queued) * 1000), latency_ms=round(latency * 1000), usage=call.usage)
+    return body
+
+async def hedged_request(payload: dict, call: RubricCall) -> dict:
+    delay = latency_tracker.percentile(HEDGE_PERCENTILE) if HEDGE_ENABLED else None
+    primary = asyncio.ensure_future(send_request(payload, call))
+    tasks = {primary}
     try:
-        response = requests.post(API_URL, headers=HEADERS, json=payload)
-        response.raise_for_status()
-        return response.json()['content'][0]['text']
-    except Exception as e:
-        print(f"API call failed: {str(e)}")
-        return None
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            # Only hedge when nothing is queued, a duplicate must not delay other calls
+            if not done and not scheduler.lanes:
+                call.attempts += 1
+                call.hedged = True
+                UPSTREAM_HEDGES.inc(rubric=current_rubric.get(), model=payload["model"])
+                tasks.add(asyncio.ensure_future(send_request(payload, call)))
+
+        error: Optional[BaseException] = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def call_claude_api(payload: dict, key: str, deadline: float) -> RubricCall:
+    loop = asyncio.get_running_loop()
+    call = RubricCall(None, key)
+    while True:
+        call.attempts += 1
+        try:
+            body = await asyncio.wait_for(hedged_request(payload, call), deadline - loop.time())
+            call.text = body['content'][0]['text']
+            call.error = None
+            return call
+        except asyncio.TimeoutError:
+            call.error = "Question deadline exceeded"
+            break
+        except UpstreamError as e:
+            call.error = str(e)
+            if not e.retryable or call.attempts >= MAX_ATTEMPTS:
+                break
+            delay = backoff_delay(call.attempts, e.retry_after)
+            if loop.time() + delay >= deadline:
+                break
+            UPSTREAM_RETRIES.inc(rubric=current_rubric.get(), model=payload["model"])
+            log_event(logging.WARNING, "upstream_retry", rubric=current_rubric.get(), attempt=call.attempts,
+                      delay_s=round(delay, 2), error=str(e))
+            await asyncio.sleep(delay)
+        except Exception as e:
+            call.error = f"API call failed: {str(e)}"
+            break
+
+    log_event(logging.ERROR, "upstream_failed", rubric=current_rubric.get(), attempts=call.attempts,
+              error=call.error)
+    return call
+
+async def iter_api_calls(prompts: Dict[str, dict], deadline: Optional[float] = None,
+                         warmup: bool = PROMPT_CACHE_WARMUP) -> AsyncIterator[Tuple[str, RubricCall]]:
+    # Yields each rubric call as soon as it finishes, cached ones first
+    payloads = {name: build_payload(prompt) for name, prompt in prompts.items()}
+    keys = {name: cache_key(payload, prompts[name].get("context")) for name, payload in payloads.items()}
+    cached = await asyncio.gather(*(rubric_cache.get(key) for key in keys.values()))
+
+    misses = []
+    for name, text in zip(keys, cached):
+        RESULT_CACHE.inc(rubric=name, outcome="hit" if text is not None else "miss")
+        if text is not None:
+            yield name, RubricCall(text, keys[name], cache_hit=True)
+        else:
+            misses.append(name)
+
+    # Only the rubric that failed is retried, within one deadline for the question
+    if deadline is None:
+        deadline = asyncio.get_running_loop().time() + QUESTION_DEADLINE
+
+    async def fetch(name: str) -> Tuple[str, RubricCall]:
+        current_rubric.set(name)
+        try:
+            return name, await call_claude_api(payloads[name], keys[name], deadline)
+        except Exception as exc:
+            log_event(logging.ERROR, "rubric_call_exception", rubric=name, error=str(exc))
+            return name, RubricCall(None, keys[name], error=f"Error: {exc}")
+
+    if warmup and len(misses) > 1:
+        yield await fetch(misses.pop(0))
+
+    tasks = [asyncio.ensure_future(fetch(name)) for name in misses]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The consumer went away (e.g. a closed stream): stop paying for calls
+        for task in tasks:
+            task.cancel()
 
-def parallel_api_calls(prompts: List[str]) -> List[str]:
-    responses = [None] * len(prompts)
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_index = {executor.submit(call_claude_api, prompt): i 
-                          for i, prompt in enumerate(prompts)}
+def context_block(data: QuestionData) -> str:
+    return f"""Context for the question under evaluation.
 
-        for future in concurrent.futures.as_completed(future_to_index):
-            index = future_to_index[future]
-            try:
-                responses[index] = future.result()
-            except Exception as exc:
-                print(f'Prompt {index} generated an exception: {exc}')
-                responses[index] = f"Error: {exc}"
-
-    return responses
-
-def generate_prompts(data: QuestionData) -> List[str]:
-    blooms_difficulty = (BLOOM_EASY if data.difficulty_level == 1 
-                        else BLOOM_MODERATE if data.difficulty_level == 2 
-                        else BLOOM_DIFFICULT)
-    
-    prompts = {
-        "prompt1": f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the clarity of this question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
-
-    Question to evaluate: #### {data.question} + {data.responses} ####
-    Article: #### {data.article} ####
+    Article:  #### {data.article} ####
+    Essential Knowledge Code:  #### {data.ek_description} ####
+    Learning Objective Code:  #### {data.lo_description} ####
+    Other questions on this topic:  #### {data.topic_questions} ####
+    Multishot for reference:  #### {data.goodqs} {data.badqs} ####"""
+
+def shared_prefix(data: QuestionData) -> List[dict]:
+    # Identical for every rubric of a question so upstream caches it once; the
+    # static reference block is also shared across questions
+    return [
+        {"type": "text", "text": REFERENCE_BLOCK, "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": context_block(data), "cache_control": {"type": "ephemeral"}},
+    ]
+
+# Rubric registry
+class PromptTemplate:
+    # Split once into literal text and $placeholders, so rendering is a join
+    def __init__(self, text: str):
+        self.parts: List[Tuple[str, Optional[str]]] = []
+        position = 0
+        for match in string.Template.pattern.finditer(text):
+            name = match.group("named") or match.group("braced")
+            literal = text[position:match.start()]
+            if name is None:
+                self.parts.append((literal + ("$" if match.group("escaped") is not None else match.group(0)), None))
+            else:
+                self.parts.append((literal, name))
+            position = match.end()
+        self.parts.append((text[position:], None))
+        self.fields = tuple(dict.fromkeys(name for _, name in self.parts if name))
+
+    def render(self, values: Dict[str, str]) -> str:
+        return "".join(literal + values[name] if name else literal for literal, name in self.parts)
+
+@dataclass(frozen=True)
+class Rubric:
+    name: str
+    inputs: Tuple[str, ...]
+    template: PromptTemplate
+    # With gating on, the rubric is skipped when any of these scored 0
+    gates: Tuple[str, ...] = ()
+    schema: Type[RubricScore] = FeedbackScore
+    # Fields of the shared context block the rubric judges against
+    context: Tuple[str, ...] = ()
+
+RUBRICS: Dict[str, Rubric] = {}
+
+CONTEXT_FIELDS = ("article", "ek_description", "lo_description", "topic_questions", "goodqs", "badqs")
+
+def register_rubric(name: str, inputs: Tuple[str, ...], text: str, gates: Tuple[str, ...] = (),
+                    schema: Type[RubricScore] = FeedbackScore, context: Tuple[str, ...] = ()) -> Rubric:
+    template = PromptTemplate(text)
+    if set(template.fields) != set(inputs):
+        raise ValueError(f"Rubric {name} declares inputs {inputs} but its template uses {template.fields}")
+    missing = [gate for gate in gates if gate not in RUBRICS]
+    if missing:
+        raise ValueError(f"Rubric {name} is gated on unregistered rubric(s): {', '.join(missing)}")
+    unknown = [field for field in context if field not in CONTEXT_FIELDS]
+    if unknown:
+        raise ValueError(f"Rubric {name} reads unknown context field(s): {', '.join(unknown)}")
+    RUBRICS[name] = Rubric(name, inputs, template, gates, schema, context)
+    return RUBRICS[name]
+
+# Clarity and format are cheap to check and reject most broken items
+CHEAP_GATES = ("prompt1", "prompt2")
+register_rubric("prompt1", ("question", "responses"), f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the clarity of this question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
+
+    Question to evaluate: #### $question + $responses ####
+    Article: the Article given in the context
     Scoring:
     Assign a score of 1 if ALL of the following conditions are met:
     +There is a singular clear interpretation of the question.
@@ -198,14 +1259,14 @@ def generate_prompts(data: QuestionData) -> List[str]:
 
     Response Format:
       Return ONLY a JSON object with this structure:
-      {JSON_RESPONSE_SCHEMA}""",
-        "prompt2": f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the format of a question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
+      {JSON_RESPONSE_SCHEMA}""", context=("article",))
+register_rubric("prompt2", ("question", "responses"), f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the format of a question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
 
-    Question to evaluate: #### {data.question} + {data.responses} ####
+    Question to evaluate: #### $question + $responses ####
     Scoring:
     Assign a score of 1 if ALL of the following conditions are met:
-    +Confirm the question has 4 or 5 answer options in #### {data.responses} #### to select from.
-    +Verify any formulas in #### {data.question} #### and #### {data.responses} #### are formatted and presented correctly in markdown + LaTeX
+    +Confirm the question has 4 or 5 answer options in #### $responses #### to select from.
+    +Verify any formulas in #### $question #### and #### $responses #### are formatted and presented correctly in markdown + LaTeX
     +Verify all necessary components (e.g., passage, stem) are present as mentioned in the question.
 
     Assign a score of 0 if ANY of the above conditions are not met.
@@ -214,21 +1275,18 @@ def generate_prompts(data: QuestionData) -> List[str]:
 
     Response Format:
       Return ONLY a JSON object with this structure:
-      {JSON_RESPONSE_SCHEMA}""",
-        "prompt3": f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the content of a question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
+      {JSON_RESPONSE_SCHEMA}""")
+register_rubric("prompt3", ("question",), f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the content of a question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
 
-    Question to evaluate: #### {data.question} ####
-    Essential Knowledge Code:  #### {data.ek_description} ####
-    Learning Objective Code:  #### {data.lo_description} ####
-    AP Skills:  #### {SKILL_DESCRIPTION} ####
-    Article:  #### {data.article} ####
+    Question to evaluate: #### $question ####
+    Essential Knowledge Code, Learning Objective Code, AP Skills and Article: as given in the reference material and context
 
     Scoring:
     Assign a score of 1 if all of the following conditions are met:
     +The question can be answered by reading the accompanying article.
-    -Even if a question contains new information it is answerable with the article if students can apply knowledge from the  #### {data.article} ####  to the new situation to come to a conclusion
+    -Even if a question contains new information it is answerable with the article if students can apply knowledge from the Article to the new situation to come to a conclusion
     +The content is culturally sensitive (e.g. correct terminology is used to represent groups, does not discuss benefits of free, unpaid, slave labor as a positive construct)
-    +The content is not similar in meaning to any other  #### {data.topic_questions} ####
+    +The content is not similar in meaning to any of the Other questions on this topic
 
     Assign a score of 0 if ANY of the above conditions are not met.
 
@@ -236,20 +1294,18 @@ def generate_prompts(data: QuestionData) -> List[str]:
 
     Response Format:
       Return ONLY a JSON object with this structure:
-      {JSON_RESPONSE_SCHEMA}""",
-        "prompt4": f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the curriculum alignment of a question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
+      {JSON_RESPONSE_SCHEMA}""", gates=CHEAP_GATES,
+                context=("ek_description", "lo_description", "article", "topic_questions"))
+register_rubric("prompt4", ("question", "responses"), f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the curriculum alignment of a question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
 
-    Question to evaluate:  #### {data.question} + {data.responses} ####
-    Essential Knowledge Code:  #### {data.ek_description} ####
-    Learning Objective Code:  #### {data.lo_description} ####
-    AP Skills:  #### {SKILL_DESCRIPTION} ####
-    Article:  #### {data.article} ####
+    Question to evaluate:  #### $question + $responses ####
+    Essential Knowledge Code, Learning Objective Code, AP Skills and Article: as given in the reference material and context
 
     Scoring:
     Assign a score of 1 if any one of the following conditions are met:
-    +The question is aligned to a specific AP skill  #### {SKILL_DESCRIPTION} ####
-    +The question is aligned to a specific AP Learning objective or  #### {data.lo_description} ####
-    +The question is aligned to a specific AP Essential Knowledge Code  #### {data.ek_description} ####
+    +The question is aligned to a specific AP skill from the AP Skills
+    +The question is aligned to a specific AP Learning objective or the Learning Objective Code
+    +The question is aligned to a specific AP Essential Knowledge Code from the Essential Knowledge Code
 
     Assign a score of 0 if NONE of the above conditions are met.
 
@@ -257,15 +1313,12 @@ def generate_prompts(data: QuestionData) -> List[str]:
 
     Response Format:
       Return ONLY a JSON object with this structure:
-      {JSON_RESPONSE_SCHEMA_2}""",
-        "prompt5": f"""As a renowned Psychometrician, assign a difficulty to the question. Apply your deep understanding of cognitive development, Bloom's Taxonomy, and Depth of Knowledge (DOK) levels in your analysis.
-
-    Question to evaluate:  #### {data.question}+{data.responses}+{data.explanations} ####
-    AP Skills: #### {data.article} ####
+      {JSON_RESPONSE_SCHEMA_2}""", gates=CHEAP_GATES, schema=AlignmentScore,
+                context=("ek_description", "lo_description", "article"))
+register_rubric("prompt5", ("question", "responses", "explanations"), f"""As a renowned Psychometrician, assign a difficulty to the question. Apply your deep understanding of cognitive development, Bloom's Taxonomy, and Depth of Knowledge (DOK) levels in your analysis.
 
-    Bloom Easy  #### {BLOOM_EASY} ####
-    Bloom Moderate  #### {BLOOM_MODERATE} ####
-    Bloom Difficult  #### {BLOOM_DIFFICULT} ####
+    Question to evaluate:  #### $question+$responses+$explanations ####
+    Article, BLOOM_EASY, BLOOM_MODERATE and BLOOM_DIFFICULT: as given in the reference material and context
 
     +The question type is "reading comprehension" and has  difficulty of 0 if all of the information required to respond is stated explicitly in the text.
     +The question type is "recall" and the difficulty is 1 if the task in the question is related to BLOOM_EASY
@@ -279,11 +1332,11 @@ def generate_prompts(data: QuestionData) -> List[str]:
 
     Response Format:
       Return ONLY a JSON object with this structure:
-      {JSON_RESPONSE_SCHEMA_3}""",
-        "prompt6": f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the correct response to a multiple choice question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
+      {JSON_RESPONSE_SCHEMA_3}""", schema=DifficultyScore, context=("article",))
+register_rubric("prompt6", ("question", "correct", "blooms_difficulty"), f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the correct response to a multiple choice question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
 
-    Question to evaluate and the correct response:  #### {data.question}+{data.correct} ####
-    TaskVerb Definition:  #### {blooms_difficulty} ####
+    Question to evaluate and the correct response:  #### $question+$correct ####
+    TaskVerb Definition:  the $blooms_difficulty list in the reference material
 
 
     Scoring:
@@ -299,12 +1352,12 @@ def generate_prompts(data: QuestionData) -> List[str]:
 
     Response Format:
       Return ONLY a JSON object with this structure:
-      {JSON_RESPONSE_SCHEMA}""",
-        "prompt7": f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the distractors of a question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
+      {JSON_RESPONSE_SCHEMA}""")
+register_rubric("prompt7", ("question", "responses", "blooms_difficulty"), f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the distractors of a question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
 
-    Question to evaluate and the responses:  #### {data.question}+{data.responses} ####
-    TaskVerb Definition:  #### {blooms_difficulty} ####
-    Multishot for reference:  #### {data.goodqs} {data.badqs} ####
+    Question to evaluate and the responses:  #### $question+$responses ####
+    TaskVerb Definition:  the $blooms_difficulty list in the reference material
+    Multishot for reference:  as given in the context
 
     A distractor is a little lie that a teacher might tell to trick a high school student who came to class, but did not read the book or study before the exam.
     Distractors should be related to the topic, and general vocabulary, of the subject, but not too difficult that a first time learner would struggle if they read the chapter well.
@@ -322,19 +1375,18 @@ def generate_prompts(data: QuestionData) -> List[str]:
 
     Response Format:
       Return ONLY a JSON object with this structure:
-      {JSON_RESPONSE_SCHEMA}""",
-        "prompt8": f"""As a preeminent AP educator and assessment expert with over three decades of cross-disciplinary experience, your task is to evaluate the quality of the distractor options. Apply your extensive knowledge of AP standards and effective pedagogical practices in your analysis.
+      {JSON_RESPONSE_SCHEMA}""", gates=CHEAP_GATES, context=("goodqs", "badqs"))
+register_rubric("prompt8", ("question", "distractors"), f"""As a preeminent AP educator and assessment expert with over three decades of cross-disciplinary experience, your task is to evaluate the quality of the distractor options. Apply your extensive knowledge of AP standards and effective pedagogical practices in your analysis.
 
-    Question to evaluate:  #### {data.question} ####
-    Distractor options:  #### {data.distractors} ####
-    Absolutes for reference:  #### {ABSOLUTES} ####
-    Patterns for reference:  #### {PATTERN_PHRASES} ####
+    Question to evaluate:  #### $question ####
+    Distractor options:  #### $distractors ####
+    Absolutes and Patterns for reference:  the ABSOLUTES and PATTERN_PHRASES lists in the reference material
 
     Scoring:
     Assign a score of 1 if all of the following conditions are met:
 
-      + Not more than one response option contain a word in the list  #### {ABSOLUTES} ####
-      + Distractors do not contain words from  #### {PATTERN_PHRASES} ####
+      + Not more than one response option contain a word in the ABSOLUTES list
+      + Distractors do not contain words from the PATTERN_PHRASES list
       Assign a score of 0 if ANY of the above conditions are not met.
 
     7. Rationale and Feedback:
@@ -342,17 +1394,17 @@ def generate_prompts(data: QuestionData) -> List[str]:
 
     8. Response Format:
       Return ONLY a JSON object with this structure:
-      {JSON_RESPONSE_SCHEMA}""",
-        "prompt9": f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the coherence of the response set of a question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
+      {JSON_RESPONSE_SCHEMA}""", gates=CHEAP_GATES)
+register_rubric("prompt9", ("question", "responses", "blooms_difficulty"), f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the coherence of the response set of a question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
 
-    Question to evaluate and the correct response:  #### {data.question}+{data.responses} ####
-    TaskVerb Definition  #### {blooms_difficulty} ####
-    Multishot for reference:  #### {data.goodqs} {data.badqs} ####
+    Question to evaluate and the correct response:  #### $question+$responses ####
+    TaskVerb Definition:  the $blooms_difficulty list in the reference material
+    Multishot for reference:  as given in the context
 
     Scoring:
     Assign a score of 1 if all of the following conditions are met:
     +All responses has the same number of commas
-    +Each Response correctly uses the task verbs ####  {blooms_difficulty} ####  to  respond to all parts of the question. (e.g. If the question asks for a comparison, a comparison is made.)
+    +Each Response correctly uses the task verbs from the $blooms_difficulty list to  respond to all parts of the question. (e.g. If the question asks for a comparison, a comparison is made.)
     +Each response is unique in interpretation from all other response options
     +There is only one response that is arguably correct for a student who has studied well
     +All responses are written in the same tense and style
@@ -364,13 +1416,13 @@ def generate_prompts(data: QuestionData) -> List[str]:
 
     Response Format:
       Return ONLY a JSON object with this structure:
-      {JSON_RESPONSE_SCHEMA}""",
-        "prompt10": f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the explanations for a response set of a question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
+      {JSON_RESPONSE_SCHEMA}""", gates=CHEAP_GATES, context=("goodqs", "badqs"))
+register_rubric("prompt10", ("question", "responses", "explanations", "blooms_difficulty"), f"""As a world-renowned expert in educational assessment with 30 years of experience designing AP exams across various subjects, your task is to evaluate the explanations for a response set of a question. Apply your unparalleled expertise and critical thinking skills to this evaluation.
 
-    Question to evaluate and the correct response:  #### {data.question}+{data.responses} ####
-    Explanations to evaluate: #### {data.explanations}
-    TaskVerb Definition:  #### {blooms_difficulty} ####
-    Multishot for reference:  #### {data.goodqs} {data.badqs} ####
+    Question to evaluate and the correct response:  #### $question+$responses ####
+    Explanations to evaluate: #### $explanations
+    TaskVerb Definition:  the $blooms_difficulty list in the reference material
+    Multishot for reference:  as given in the context
 
     Scoring:
     Assign a score of 1 if all of the following conditions are met:
@@ -386,37 +1438,1304 @@ def generate_prompts(data: QuestionData) -> List[str]:
 
     Response Format:
       Return ONLY a JSON object with this structure:
-      {JSON_RESPONSE_SCHEMA}"""
-    }
-    
-    return list(prompts.values())
+      {JSON_RESPONSE_SCHEMA}""", gates=CHEAP_GATES, context=("goodqs", "badqs"))
+
+RUBRIC_NAMES = list(RUBRICS)
+
+def rubric_inputs(data: QuestionData) -> Dict[str, str]:
+    values = {field: str(value) for field, value in data.model_dump(exclude={"rubrics"}).items()}
+    values["blooms_difficulty"] = ("BLOOM_EASY" if data.difficulty_level == 1
+                                   else "BLOOM_MODERATE" if data.difficulty_level == 2
+                                   else "BLOOM_DIFFICULT")
+    return values
+
+def generate_prompts(data: QuestionData, names: Optional[List[str]] = None) -> Dict[str, dict]:
+    values = rubric_inputs(data)
+    # Rubric specific instructions follow the shared, cacheable prefix
+    system = shared_prefix(data)
+    return {name: {"system": system, "content": RUBRICS[name].template.render(values),
+                   "context": {field: values[field] for field in RUBRICS[name].context}}
+            for name in names or RUBRIC_NAMES}
+
+# Local rule engine for the mechanical parts of the rubrics
+class PhraseMatcher:
+    # Aho-Corasick automaton: one pass over the text finds every listed phrase
+    def __init__(self, phrases: List[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[str]] = [[]]
+
+        for phrase in phrases:
+            node = 0
+            for char in phrase:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][char] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                node = child
+            self.output[node].append(phrase)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, text: str) -> List[str]:
+        text = " ".join(text.lower().split())
+        found = []
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for phrase in self.output[node]:
+                # Only whole words count, so "all" does not match "tall"
+                start = end - len(phrase) + 1
+                if ((start == 0 or not text[start - 1].isalnum())
+                        and (end + 1 == len(text) or not text[end + 1].isalnum())):
+                    found.append(phrase)
+        return found
+
+def phrase_list(text: str) -> List[str]:
+    phrases = (" ".join(phrase.lower().split()) for phrase in text.split(","))
+    return list(dict.fromkeys(phrase for phrase in phrases if phrase))
+
+ABSOLUTES_MATCHER = PhraseMatcher(phrase_list(ABSOLUTES))
+PATTERN_PHRASES_MATCHER = PhraseMatcher(phrase_list(PATTERN_PHRASES))
+
+OPTION_LABEL = re.compile(r"^\s*(?:\(?[A-Ea-e][.):]|\(?[1-5][.)])\s+")
+INLINE_OPTION_LABEL = re.compile(r"(?:^|\s)\(?[A-E][.)]\s+")
+
+def split_options(text: str) -> List[str]:
+    text = text.strip()
+    try:
+        options = json.loads(text)
+        if isinstance(options, list) and all(isinstance(option, str) for option in options):
+            return [option.strip() for option in options if option.strip()]
+    except ValueError:
+        pass
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) == 1:
+        inline = [part for part in INLINE_OPTION_LABEL.split(lines[0]) if part.strip()]
+        if len(inline) > 1:
+            lines = inline
+    if not any(OPTION_LABEL.match(line) for line in lines):
+        return [line.strip() for line in lines]
+
+    # Unlabelled lines continue the option above them
+    options: List[str] = []
+    for line in lines:
+        if OPTION_LABEL.match(line) or not options:
+            options.append(OPTION_LABEL.sub("", line).strip())
+        else:
+            options[-1] += " " + line.strip()
+    return options
+
+def rule_result(score: int, rationale: str, feedback: str) -> dict:
+    return {"score": score, "rationale": rationale, "feedback": feedback, "source": "rules"}
+
+def check_option_count(data: QuestionData) -> Optional[dict]:
+    options = split_options(data.responses)
+    if len(options) < 2:
+        # Unrecognised layout, leave it to the LLM
+        return None
+    if len(options) in (4, 5):
+        return rule_result(1, f"The question has {len(options)} answer options.",
+                           "No change needed to the number of answer options.")
+    return rule_result(0, f"The question has {len(options)} answer options instead of 4 or 5.",
+                       "Add or remove answer options so there are 4 or 5 to choose from.")
+
+def check_distractor_length(data: QuestionData) -> Optional[dict]:
+    correct = split_options(data.correct)
+    distractors = split_options(data.distractors)
+    # Only trust the split when it accounts for every other option
+    if len(correct) != 1 or len(distractors) != len(split_options(data.responses)) - 1:
+        return None
+    correct_words = len(correct[0].split())
+    outliers = [d for d in distractors if abs(len(d.split()) - correct_words) > 2]
+    if not outliers:
+        return rule_result(1, "Every distractor is within 2 words of the correct response's length.",
+                           "No change needed to distractor length.")
+    return rule_result(0, f"{len(outliers)} distractor(s) differ from the {correct_words}-word correct response by more than 2 words.",
+                       "Shorten or lengthen these distractors to match the correct response: " + "; ".join(outliers))
+
+def check_absolutes(data: QuestionData) -> Optional[dict]:
+    options = split_options(data.responses)
+    distractors = split_options(data.distractors)
+    if not options or not distractors:
+        return None
+    with_absolutes = [option for option in options if ABSOLUTES_MATCHER.find(option)]
+    patterns = sorted({phrase for d in distractors for phrase in PATTERN_PHRASES_MATCHER.find(d)})
+
+    problems = []
+    if len(with_absolutes) > 1:
+        problems.append(f"{len(with_absolutes)} response options contain absolutes")
+    if patterns:
+        problems.append("distractors use pattern phrases: " + ", ".join(patterns))
+    if not problems:
+        return rule_result(1, "At most one response option contains an absolute and no distractor uses a pattern phrase.",
+                           "No change needed to absolute or pattern wording.")
+    return rule_result(0, "; ".join(problems).capitalize() + ".",
+                       "Replace absolute words and pattern phrases in the distractors with qualified wording.")
+
+def check_comma_counts(data: QuestionData) -> Optional[dict]:
+    options = split_options(data.responses)
+    if len(options) < 2:
+        return None
+    counts = [option.count(",") for option in options]
+    if len(set(counts)) == 1:
+        return rule_result(1, "All responses have the same number of commas.",
+                           "No change needed to response punctuation.")
+    return rule_result(0, f"Responses have differing comma counts: {counts}.",
+                       "Rewrite the responses so they share the same structure and number of commas.")
+
+LOCAL_RULES = {
+    "prompt2": check_option_count,
+    "prompt7": check_distractor_length,
+    "prompt8": check_absolutes,
+    "prompt9": check_comma_counts,
+}
+# Rubrics whose every condition is mechanical; the others still need the LLM
+# for their judgment conditions when the local check passes
+RULE_ONLY_RUBRICS = {"prompt8"}
+# The condition line each local check settles, dropped from the prompt once
+# the check has passed
+RULE_CONDITIONS = {
+    "prompt2": "+Confirm the question has 4 or 5 answer options",
+    "prompt7": "+Each distractor is not more than 2 words longer or shorter",
+    "prompt9": "+All responses has the same number of commas",
+}
+
+def without_verified_condition(name: str, prompt: dict, verdict: dict) -> dict:
+    condition = RULE_CONDITIONS.get(name)
+    if condition is None:
+        return prompt
+    lines = [f"    Already verified locally, do not judge it again: {verdict['rationale']}"
+             if line.strip().startswith(condition) else line for line in prompt["content"].splitlines()]
+    return dict(prompt, content="\n".join(lines))
+
+def run_rules(data: QuestionData, names: Optional[List[str]] = None) -> Dict[str, dict]:
+    verdicts = {}
+    for name, rule in LOCAL_RULES.items():
+        if names is not None and name not in names:
+            continue
+        verdict = rule(data)
+        if verdict is not None:
+            verdicts[name] = verdict
+    return verdicts
+
+async def narrow_topic_questions(data: QuestionData) -> Tuple[QuestionData, Optional[List[dict]]]:
+    # The prompt carries the nearest topic questions instead of the whole bank
+    if not data.topic or TOPIC_TOP_K <= 0:
+        return data, None
+    await topic_index.add(data.topic, split_topic_questions(data.topic_questions))
+    similar = [item for item in await topic_index.nearest(data.topic, data.question, TOPIC_TOP_K)
+               if item["similarity"] >= TOPIC_MIN_SIMILARITY]
+    listing = "\n".join(f"{item['question']} (similarity {item['similarity']:.2f})" for item in similar)
+    return data.model_copy(update={"topic_questions": listing or "None"}), similar
+
+def compact_article(data: QuestionData, budget: int) -> Tuple[QuestionData, Optional[dict]]:
+    # Every rubric shares the article through the prompt prefix, so one
+    # selection serves them all
+    if budget <= 0 or text_tokens(data.article) <= budget:
+        return data, None
+    digest, index = article_index(data.article)
+    chosen = index.select(f"{data.question}\n{data.responses}", budget)
+    passages = "\n[...]\n".join(index.chunks[position] for position, _ in chosen)
+    report = {"article": digest, "chunks": len(index.chunks), "budget_tokens": budget,
+              "article_tokens": text_tokens(data.article),
+              "used_tokens": sum(index.tokens[position] for position, _ in chosen),
+              "passages": [{"index": position, "score": round(score, 3), "tokens": index.tokens[position]}
+                           for position, score in chosen]}
+    return data.model_copy(update={"article": passages}), report
+
+def split_by_rules(data: QuestionData, mode: CheckMode) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+    # Returns the rubrics settled by local checks and the prompts still to send
+    names = data.rubrics or RUBRIC_NAMES
+    prompts = generate_prompts(data, names)
+    verdicts = run_rules(data, names) if mode != "llm" else {}
+    decided = {}
+    pending = {}
+    for name, prompt in prompts.items():
+        verdict = verdicts.get(name)
+        # A failed check fails the rubric; a pass only settles rule-only rubrics
+        final = verdict is not None and (verdict["score"] == 0 or name in RULE_ONLY_RUBRICS)
+        if final:
+            decided[name] = verdict
+        elif mode == "rules" and verdict is not None:
+            decided[name] = {"skipped": "The local check passed but the other conditions need the LLM",
+                             "rules": verdict}
+        elif mode == "rules":
+            decided[name] = {"skipped": "No local rule decides this rubric"}
+        elif verdict is not None:
+            pending[name] = without_verified_condition(name, prompt, verdict)
+        else:
+            pending[name] = prompt
+    return decided, pending
+
+# Structured output parsing: strict JSON first, then a repair pass for fenced,
+# truncated or sloppy replies; the text is never executed
+PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+BARE_TOKEN = re.compile(r"[\w.+-]+")
+
+def json_loads(text: str):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+def json_span(text: str) -> str:
+    # The first object or array, ignoring fences and prose around it; closers
+    # are added if the reply was cut off
+    start = min((position for position in (text.find("{"), text.find("[")) if position >= 0), default=-1)
+    if start < 0:
+        raise ValueError("no JSON object in reply")
+    closers = []
+    quote = None
+    position = start
+    while position < len(text):
+        char = text[position]
+        if quote:
+            if char == "\\":
+                position += 1
+            elif char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]":
+            closers.pop()
+            if not closers:
+                return text[start:position + 1]
+        position += 1
+    return text[start:] + (quote or "") + "".join(reversed(closers))
+
+def repair_json(text: str) -> str:
+    # Re-emits the text token by token: single quotes become double quotes,
+    # Python literals become JSON ones, trailing commas go and missing
+    # commas between values come back
+    out = []
+    value_ended = False
+    position = 0
+    while position < len(text):
+        char = text[position]
+        if char in "\"'":
+            end = position + 1
+            chars = []
+            while end < len(text) and text[end] != char:
+                if text[end] == "\\" and end + 1 < len(text):
+                    escaped = text[end + 1]
+                    chars.append(escaped if char == "'" and escaped == "'" else text[end:end + 2])
+                    end += 2
+                    continue
+                chars.append('\\"' if text[end] == '"' else "\\n" if text[end] == "\n" else text[end])
+                end += 1
+            if value_ended:
+                out.append(",")
+            out.append('"' + "".join(chars) + '"')
+            position = end + 1
+            value_ended = True
+        elif char.isspace():
+            out.append(char)
+            position += 1
+        elif char == ":":
+            out.append(char)
+            position += 1
+            value_ended = False
+        elif char == ",":
+            following = text[position + 1:].lstrip()
+            if not following.startswith(("}", "]")):
+                out.append(char)
+            position += 1
+            value_ended = False
+        elif char in "{[":
+            if value_ended:
+                out.append(",")
+            out.append(char)
+            position += 1
+            value_ended = False
+        elif char in "}]":
+            out.append(char)
+            position += 1
+            value_ended = True
+        else:
+            match = BARE_TOKEN.match(text, position)
+            if match is None:
+                out.append(char)
+                position += 1
+                continue
+            if value_ended:
+                out.append(",")
+            out.append(PYTHON_LITERALS.get(match.group(), match.group()))
+            position = match.end()
+            value_ended = True
+    return "".join(out)
+
+def reply_shaped(value: object) -> bool:
+    # A rubric object or a consolidated array of them
+    return isinstance(value, dict) or (isinstance(value, list) and bool(value)
+                                       and all(isinstance(item, dict) for item in value))
+
+def embedded_json(text: str) -> Optional[object]:
+    # The first well formed reply inside surrounding prose; braces in the
+    # prose itself are skipped over
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"[{\[]", text):
+        try:
+            value, _ = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        if reply_shaped(value):
+            return value
+    return None
+
+def load_json_reply(text: str) -> Tuple[object, bool]:
+    # Returns the decoded value and whether it needed repair
+    try:
+        return json_loads(text), False
+    except ValueError:
+        pass
+    # The outermost span is repaired first, so a malformed array is never
+    # mistaken for its first element; only when that fails are inner
+    # candidates tried, for prose with braces ahead of the reply
+    try:
+        value = json_loads(repair_json(json_span(text)))
+    except ValueError as e:
+        value, error = None, e
+    if reply_shaped(value):
+        return value, True
+    embedded = embedded_json(text)
+    if embedded is not None:
+        return embedded, True
+    if value is None:
+        raise error
+    return value, True
+
+def validate_rubric(name: str, value: object) -> dict:
+    if not isinstance(value, dict):
+        raise ValueError(f"expected a JSON object, got {type(value).__name__}")
+    return RUBRICS[name].schema.model_validate(value).model_dump()
+
+async def parse_call(call: RubricCall, name: str, store: bool = True) -> dict:
+    response = call.text
+    if not (response and isinstance(response, str)):
+        return {"error": call.error or "Invalid response"}
+    try:
+        value, call.repaired = load_json_reply(response)
+        parsed = validate_rubric(name, value)
+    except ValueError as e:
+        PARSE_FAILURES.inc(rubric=name)
+        log_event(logging.WARNING, "parse_failed", rubric=name, error=str(e))
+        return {"error": f"Failed to parse response: {str(e)}"}
+
+    if call.repaired:
+        PARSE_REPAIRS.inc(rubric=name)
+    # Only responses that parse are worth serving again, cleaned up so a
+    # cache hit takes the strict path
+    if store and not call.cache_hit:
+        await rubric_cache.put(call.cache_key, json.dumps(parsed) if call.repaired else response)
+    return parsed
+
+def parse_rubric_groups(spec: str) -> List[List[str]]:
+    groups = []
+    seen: Set[str] = set()
+    for group_spec in spec.split(";"):
+        group = [name.strip() for name in group_spec.split(",") if name.strip()]
+        unknown = [name for name in group if name not in RUBRIC_NAMES]
+        if unknown:
+            raise ValueError(f"Unknown rubric(s) in groups: {', '.join(unknown)}")
+        if seen.intersection(group) or len(set(group)) != len(group):
+            raise ValueError("A rubric can only belong to one group")
+        seen.update(group)
+        if len(group) > 1:
+            groups.append(group)
+    return groups
+
+DEFAULT_RUBRIC_GROUPS = parse_rubric_groups(RUBRIC_GROUPS)
+
+def rubric_groups(groups: str = RUBRIC_GROUPS) -> List[List[str]]:
+    try:
+        return parse_rubric_groups(groups)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def consolidated_content(members: List[str], prompts: Dict[str, dict]) -> str:
+    sections = "\n\n".join(f'Rubric "{name}":\n    {prompts[name]["content"]}' for name in members)
+    return f"""Apply each of the following {len(members)} rubrics to the same question. Evaluate every rubric independently, exactly as if it had been asked on its own.
+
+{sections}
+
+    Response Format:
+      Ignore the response format given inside each rubric. Return ONLY a JSON array with one object per rubric, in the order given. Each object has a "rubric" field with the rubric name ({", ".join(members)}) and the fields of that rubric's structure."""
+
+def consolidate_prompts(pending: Dict[str, dict], groups: List[List[str]]) -> Tuple[Dict[str, dict], Dict[str, List[str]]]:
+    # Returns the calls to make and, for consolidated calls, the rubrics in them
+    calls = dict(pending)
+    members_of = {}
+    for group in groups:
+        members = [name for name in group if name in pending]
+        if len(members) < 2:
+            continue
+        call_name = "+".join(members)
+        for name in members:
+            del calls[name]
+        # Every rubric shares the same cacheable prefix
+        calls[call_name] = {"system": pending[members[0]]["system"],
+                            "content": consolidated_content(members, pending),
+                            "context": {field: value for name in members
+                                        for field, value in pending[name].get("context", {}).items()}}
+        members_of[call_name] = members
+    return calls, members_of
+
+async def parse_group_call(call: RubricCall, members: List[str]) -> Dict[str, dict]:
+    if not (call.text and isinstance(call.text, str)):
+        return {name: {"error": call.error or "Invalid response"} for name in members}
+    try:
+        items, call.repaired = load_json_reply(call.text)
+        if not isinstance(items, list):
+            raise ValueError("expected a JSON array")
+    except ValueError as e:
+        for name in members:
+            PARSE_FAILURES.inc(rubric=name)
+        log_event(logging.WARNING, "parse_failed", rubric="+".join(members), error=str(e))
+        return {name: {"error": f"Failed to parse response: {str(e)}"} for name in members}
+
+    by_name = {item.get("rubric"): item for item in items if isinstance(item, dict)}
+    results = {}
+    for position, name in enumerate(members):
+        item = by_name.get(name)
+        if item is None and position < len(items) and isinstance(items[position], dict) \
+                and "rubric" not in items[position]:
+            item = items[position]
+        if item is None:
+            PARSE_FAILURES.inc(rubric=name)
+            results[name] = {"error": "Missing from consolidated response"}
+            continue
+        try:
+            results[name] = validate_rubric(name, {key: value for key, value in item.items() if key != "rubric"})
+        except ValueError as e:
+            PARSE_FAILURES.inc(rubric=name)
+            results[name] = {"error": f"Failed to parse response: {str(e)}"}
+
+    if call.repaired:
+        for name in members:
+            PARSE_REPAIRS.inc(rubric=name)
+    # Only responses that parse are worth serving again
+    if not call.cache_hit and all("error" not in result for result in results.values()):
+        await rubric_cache.put(call.cache_key, json.dumps([dict(result, rubric=name) for name, result in results.items()])
+                               if call.repaired else call.text)
+    return results
+
+# An unparseable reply gets one short follow-up for that rubric alone
+REASK_ENABLED = os.environ.get("QC_REASK", "1") == "1"
+REASK_MAX_TOKENS = int(os.environ.get("QC_REASK_MAX_TOKENS", "1024"))
+REASK_PROMPT = """Your reply could not be read: {error}
+Reply again with only the JSON object for rubric "{name}", in the response format given above, and nothing else."""
+
+async def reask_rubric(name: str, prompt: dict, reply: str, error: str, deadline: float) -> dict:
+    payload = build_payload(prompt)
+    payload["max_tokens"] = REASK_MAX_TOKENS
+    payload["messages"] += [{"role": "assistant", "content": reply.strip()},
+                            {"role": "user", "content": REASK_PROMPT.format(error=error, name=name)}]
+    current_rubric.set(name)
+    # The prompt holds the bad reply, so no later call would ask for it again;
+    # the caller caches a good answer under the original prompt's key instead
+    call = await call_claude_api(payload, cache_key(build_payload(prompt), prompt.get("context")), deadline)
+    parsed = await parse_call(call, name, store=False)
+    PARSE_REASKS.inc(rubric=name, outcome="failed" if "error" in parsed else "ok")
+    return parsed
+
+def parsing_report(parsing: Dict[str, dict]) -> dict:
+    total = len(parsing)
+    return {"rubrics": parsing,
+            "repair_rate": round(sum(info["repaired"] for info in parsing.values()) / total, 3) if total else 0.0,
+            "reask_rate": round(sum(info["reasked"] for info in parsing.values()) / total, 3) if total else 0.0}
+
+def call_timing(call: RubricCall, parse_seconds: float) -> dict:
+    return {"queue_ms": round(call.queue_seconds * 1000, 1),
+            "upstream_ms": round(call.upstream_seconds * 1000, 1),
+            "parse_ms": round(parse_seconds * 1000, 3),
+            "input_tokens": call.usage.get("input_tokens", 0),
+            "output_tokens": call.usage.get("output_tokens", 0),
+            "cache_read_input_tokens": call.usage.get("cache_read_input_tokens", 0)}
+
+async def iter_rubric_calls(pending: Dict[str, dict], groups: List[List[str]], deadline: float, warmup: bool,
+                            cache: Dict[str, dict], attempts: Dict[str, dict], timings: Dict[str, dict],
+                            parsing: Dict[str, dict]) -> AsyncIterator[Tuple[str, dict]]:
+    calls, members_of = consolidate_prompts(pending, groups)
+    # Parsed rubrics, including re-asked ones, meet in one queue so a re-ask
+    # never holds back a result that is already in; None marks the end
+    queue: asyncio.Queue = asyncio.Queue()
+    reasks: List[asyncio.Future] = []
+
+    async def reask(name: str, call_name: str, call: RubricCall, error: str, parse_seconds: float) -> None:
+        parsed = await reask_rubric(name, calls[call_name], call.text, error, deadline)
+        if call_name not in members_of and "error" not in parsed:
+            await rubric_cache.put(call.cache_key, json.dumps(parsed))
+        queue.put_nowait((name, call_name, call, parse_seconds, parsed, True))
+
+    async def parse_calls() -> None:
+        try:
+            async for call_name, call in iter_api_calls(calls, deadline, warmup):
+                members = members_of.get(call_name)
+                started = time.perf_counter()
+                if members is None:
+                    results = {call_name: await parse_call(call, call_name)}
+                else:
+                    results = await parse_group_call(call, members)
+                parse_seconds = time.perf_counter() - started
+                PARSE_SECONDS.observe(parse_seconds, rubric=call_name)
+                for name, parsed in results.items():
+                    if REASK_ENABLED and call.text and "error" in parsed:
+                        reasks.append(asyncio.ensure_future(reask(name, call_name, call, parsed["error"],
+                                                                  parse_seconds)))
+                    else:
+                        queue.put_nowait((name, call_name, call, parse_seconds, parsed, False))
+            await asyncio.gather(*reasks)
+        finally:
+            queue.put_nowait(None)
+
+    producer = asyncio.ensure_future(parse_calls())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            name, call_name, call, parse_seconds, parsed, reasked = item
+            group = {"group": call_name} if call_name in members_of else {}
+            cache[name] = dict({"hit": call.cache_hit, "key": call.cache_key}, **group)
+            attempts[name] = dict({"attempts": call.attempts, "hedged": call.hedged}, **group)
+            timings[name] = dict(call_timing(call, parse_seconds), **group)
+            parsing[name] = {"repaired": call.repaired, "reasked": reasked}
+            yield name, parsed
+        await producer
+    finally:
+        # The consumer went away (e.g. a closed stream): stop calls and re-asks
+        producer.cancel()
+        for task in reasks:
+            task.cancel()
+
+def failed_score(result: Optional[dict]) -> bool:
+    return result is not None and str(result.get("score")) == "0"
+
+async def iter_analysis(data: QuestionData, mode: CheckMode = CHECK_MODE,
+                        groups: Optional[List[List[str]]] = None, gating: bool = GATING,
+                        timings: bool = False,
+                        article_budget: int = ARTICLE_TOKEN_BUDGET) -> AsyncIterator[Tuple[str, dict]]:
+    # Yields (rubric, result) pairs as they are decided, then per-rubric
+    # ("cache", ...), ("attempts", ...) and ("parsing", ...) reports,
+    # ("similar", ...) for questions with a topic, ("passages", ...) when the
+    # article was cut down and ("timings", ...) if asked
+    trace_id = uuid.uuid4().hex
+    current_trace_id.set(trace_id)
+    started = time.monotonic()
+    data, similar = await narrow_topic_questions(data)
+    data, passages = compact_article(data, article_budget)
+    decided, pending = split_by_rules(data, mode)
+    for name, verdict in decided.items():
+        yield name, verdict
+
+    groups = DEFAULT_RUBRIC_GROUPS if groups is None else groups
+    deadline = asyncio.get_running_loop().time() + QUESTION_DEADLINE
+    cache: Dict[str, dict] = {}
+    attempts: Dict[str, dict] = {}
+    rubric_timings: Dict[str, dict] = {}
+    parsing: Dict[str, dict] = {}
+
+    # With gating, gated rubrics wait for their gates and are skipped if one scored 0
+    gated = {}
+    if gating:
+        gated = {name: prompt for name, prompt in pending.items() if RUBRICS[name].gates}
+        pending = {name: prompt for name, prompt in pending.items() if name not in gated}
+
+    # Make parallel API calls; every round feeds one queue, None marks a round done
+    results = dict(decided)
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run_round(calls: Dict[str, dict], warmup: bool) -> None:
+        try:
+            async for item in iter_rubric_calls(calls, groups, deadline, warmup, cache, attempts,
+                                                rubric_timings, parsing):
+                await queue.put(item)
+        finally:
+            queue.put_nowait(None)
+
+    rounds = [asyncio.ensure_future(run_round(pending, PROMPT_CACHE_WARMUP))]
+    running = 1
+    try:
+        while True:
+            # A gated rubric starts as soon as its own gates have results
+            ready = [name for name, prompt in gated.items()
+                     if not any(gate in pending and gate not in results for gate in RUBRICS[name].gates)]
+            runnable = {}
+            for name in ready:
+                prompt = gated.pop(name)
+                failed = [gate for gate in RUBRICS[name].gates if failed_score(results.get(gate))]
+                if failed:
+                    yield name, {"skipped": f"Gate {', '.join(failed)} scored 0"}
+                else:
+                    runnable[name] = prompt
+            if runnable:
+                # The first round already writes the shared prefix upstream
+                rounds.append(asyncio.ensure_future(run_round(runnable, PROMPT_CACHE_WARMUP and not pending)))
+                running += 1
+            if not running:
+                break
+            item = await queue.get()
+            if item is None:
+                running -= 1
+                continue
+            name, parsed = item
+            results[name] = parsed
+            yield name, parsed
+        await asyncio.gather(*rounds)
+    finally:
+        # The consumer went away (e.g. a closed stream): stop every round
+        for task in rounds:
+            task.cancel()
+
+    elapsed = time.monotonic() - started
+    QUESTION_SECONDS.observe(elapsed, mode=mode)
+    log_event(logging.INFO, "question_analyzed", mode=mode, total_ms=round(elapsed * 1000),
+              upstream_calls=len({info.get("group", name) for name, info in cache.items() if not info["hit"]}),
+              cache_hits=sum(info["hit"] for info in cache.values()),
+              input_tokens=sum(info["input_tokens"] for info in rubric_timings.values()),
+              output_tokens=sum(info["output_tokens"] for info in rubric_timings.values()))
+
+    yield "cache", cache
+    yield "attempts", attempts
+    yield "parsing", parsing_report(parsing)
+    if similar is not None:
+        yield "similar", {"topic": data.topic, "questions": similar}
+    if passages is not None:
+        # Rule-decided rubrics never saw the article
+        used = [passage["index"] for passage in passages["passages"]]
+        yield "passages", dict(passages, rubrics={name: used for name in cache})
+    if timings:
+        yield "timings", {"trace_id": trace_id, "total_ms": round(elapsed * 1000, 1), "rubrics": rubric_timings}
+
+async def analyze(data: QuestionData, mode: CheckMode = CHECK_MODE,
+                  groups: Optional[List[List[str]]] = None, gating: bool = GATING,
+                  timings: bool = False, article_budget: int = ARTICLE_TOKEN_BUDGET) -> Dict[str, dict]:
+    # Keep prompt1..prompt10 in order whatever order they finish in
+    result: Dict[str, dict] = dict.fromkeys(data.rubrics or RUBRIC_NAMES)
+    async for name, value in iter_analysis(data, mode, groups, gating, timings, article_budget):
+        result[name] = value
+    return result
+
+def failed_rubrics(result: Dict[str, dict]) -> List[str]:
+    # Upstream or parse errors; "skipped" rubrics were settled on purpose
+    return [name for name, value in result.items()
+            if name in RUBRICS and isinstance(value, dict) and "error" in value]
 
 @app.post("/analyze-question")
-async def analyze_question(data: QuestionData) -> Dict[str, dict]:
+async def analyze_question(data: QuestionData, mode: CheckMode = CHECK_MODE,
+                           groups: List[List[str]] = Depends(rubric_groups),
+                           gating: bool = GATING, timings: bool = False,
+                           article_budget: int = ARTICLE_TOKEN_BUDGET) -> Dict[str, dict]:
+    try:
+        current_lane.set(f"question-{uuid.uuid4().hex}")
+        return await analyze(data, mode, groups, gating, timings, article_budget)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analyze-questions")
+async def analyze_questions(items: List[QuestionData], mode: CheckMode = CHECK_MODE,
+                            groups: List[List[str]] = Depends(rubric_groups),
+                            gating: bool = GATING, timings: bool = False,
+                            article_budget: int = ARTICLE_TOKEN_BUDGET) -> List[Dict[str, dict]]:
     try:
-        # Generate all prompts
-        prompts = generate_prompts(data)
-        
-        # Make parallel API calls
-        responses = parallel_api_calls(prompts)
-        
-        # Format response
-        result = {}
-        for i, response in enumerate(responses, 1):
+        # The whole batch shares one lane so it cannot crowd out single questions
+        current_lane.set(f"batch-{uuid.uuid4().hex}")
+        return list(await asyncio.gather(*(analyze(data, mode, groups, gating, timings, article_budget)
+                                           for data in items)))
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.post("/admin/cache/invalidate")
+async def invalidate_cache(request: CacheInvalidation) -> Dict[str, int]:
+    # Without keys the whole cache is dropped
+    removed = await rubric_cache.invalidate(request.keys)
+    return {"removed": removed}
+
+@app.post("/topics/{topic}/questions")
+async def add_topic_questions(topic: str, request: TopicQuestions) -> Dict[str, int]:
+    # Accepted questions join the topic's near-duplicate index
+    added, total = await topic_index.add(topic, [question for question in request.questions if question.strip()])
+    return {"added": added, "total": total}
+
+@app.get("/topics/{topic}/similar")
+async def similar_topic_questions(topic: str, question: str, k: int = TOPIC_TOP_K) -> dict:
+    started = time.perf_counter()
+    similar = await topic_index.nearest(topic, question, k)
+    return {"topic": topic, "similar": similar, "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+@app.post("/analyze-question/stream")
+async def analyze_question_stream(data: QuestionData, mode: CheckMode = CHECK_MODE,
+                                  groups: List[List[str]] = Depends(rubric_groups),
+                                  gating: bool = GATING, timings: bool = False,
+                                  article_budget: int = ARTICLE_TOKEN_BUDGET,
+                                  format: Literal["ndjson", "sse"] = "ndjson") -> StreamingResponse:
+    async def events():
+        current_lane.set(f"question-{uuid.uuid4().hex}")
+        started = time.monotonic()
+        result: Dict[str, dict] = dict.fromkeys(data.rubrics or RUBRIC_NAMES)
+        try:
+            async for name, value in iter_analysis(data, mode, groups, gating, timings, article_budget):
+                result[name] = value
+                if name in RUBRICS:
+                    yield encode_event("rubric", {"rubric": name, "result": value,
+                                                  "elapsed_ms": round((time.monotonic() - started) * 1000)})
+            yield encode_event("summary", {"result": result,
+                                           "elapsed_ms": round((time.monotonic() - started) * 1000)})
+        except Exception as e:
+            yield encode_event("error", {"detail": str(e)})
+
+    def encode_event(event: str, body: dict) -> str:
+        if format == "sse":
+            return f"event: {event}\ndata: {json.dumps(body)}\n\n"
+        return json.dumps({"event": event, **body}) + "\n"
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+# Offline bulk QC: JSONL in, checkpointed JSONL out
+def record_id(record: dict) -> str:
+    if record.get("id") is not None:
+        return str(record["id"])
+    canonical = json.dumps(record, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def iter_records(path: str) -> Iterator[Tuple[int, Optional[dict]]]:
+    # One line at a time, the item bank is never held in memory
+    with open(path, encoding="utf-8") as handle:
+        for line_no, line in enumerate(handle, 1):
+            if not line.strip():
+                continue
             try:
-                # Parse JSON response if valid
-                if response and isinstance(response, str):
-                    result[f"prompt{i}"] = eval(response)
-                else:
-                    result[f"prompt{i}"] = {"error": "Invalid response"}
+                yield line_no, json.loads(line)
+            except ValueError:
+                yield line_no, None
+
+def count_records(path: str) -> int:
+    with open(path, encoding="utf-8") as handle:
+        return sum(1 for line in handle if line.strip())
+
+def load_manifest(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as handle:
+        return {line.strip() for line in handle if line.strip()}
+
+class BulkProgress:
+    def __init__(self, total: int, skipped: int, interval: float):
+        self.total = total
+        self.skipped = skipped
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.reported = self.started
+
+    def update(self, failed: bool = False) -> None:
+        self.done += 1
+        self.failed += failed
+        now = time.monotonic()
+        if now - self.reported >= self.interval:
+            self.report(now)
+
+    def report(self, now: Optional[float] = None) -> None:
+        now = now or time.monotonic()
+        self.reported = now
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - self.skipped - self.done)
+        eta = time.strftime("%H:%M:%S", time.gmtime(remaining / rate)) if rate > 0 else "--:--:--"
+        print(f"[qc] {self.skipped + self.done}/{self.total} done ({self.skipped} skipped, {self.failed} failed) "
+              f"{rate:.2f} q/s, ETA {eta}", file=sys.stderr, flush=True)
+
+async def run_bulk_qc(input_path: str, output_path: str, manifest_path: str, errors_path: str, concurrency: int,
+                      mode: CheckMode, groups: List[List[str]], gating: bool,
+                      progress_interval: float) -> None:
+    completed = load_manifest(manifest_path)
+    progress = BulkProgress(count_records(input_path), len(completed), progress_interval)
+    current_lane.set("bulk")
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    with open(output_path, "a", encoding="utf-8") as output, open(manifest_path, "a", encoding="utf-8") as manifest, \
+            open(errors_path, "a", encoding="utf-8") as errors:
+        def finish(item_id: str, line: dict, checkpoint: bool) -> None:
+            # Items the next run retries go to the error log, so the output
+            # holds one line per checkpointed id
+            if not checkpoint:
+                errors.write(json.dumps(line) + "\n")
+                errors.flush()
+                return
+            output.write(json.dumps(line) + "\n")
+            output.flush()
+            # The manifest is written after the output line, so a crash in
+            # between re-runs the item rather than losing it
+            manifest.write(item_id + "\n")
+            manifest.flush()
+            completed.add(item_id)
+
+        async def worker() -> None:
+            while True:
+                job = await queue.get()
+                if job is None:
+                    return
+                item_id, line_no, record = job
+                try:
+                    data = QuestionData(**record)
+                except Exception as e:
+                    finish(item_id, {"id": item_id, "line": line_no, "error": f"Invalid record: {str(e)}"}, True)
+                    progress.update(failed=True)
+                    continue
+                try:
+                    result = await analyze(data, mode, groups, gating)
+                    # Items with failed rubrics are not checkpointed, so the next run retries them
+                    failed = failed_rubrics(result)
+                    finish(item_id, {"id": item_id, "line": line_no, "result": result}, not failed)
+                    progress.update(failed=bool(failed))
+                except Exception as e:
+                    # Not checkpointed, so the next run retries it
+                    finish(item_id, {"id": item_id, "line": line_no, "error": str(e)}, False)
+                    progress.update(failed=True)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+        try:
+            for line_no, record in iter_records(input_path):
+                if record is None:
+                    print(f"[qc] line {line_no}: not valid JSON, skipped", file=sys.stderr)
+                    progress.update(failed=True)
+                    continue
+                item_id = record_id(record)
+                if item_id in completed:
+                    continue
+                await queue.put((item_id, line_no, record))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            progress.report()
+            await close_http_client()
+            rubric_cache.close()
+
+# Persistent job queue for large submissions
+JOBS_PATH = os.environ.get("QC_JOBS_PATH", "qc_jobs.sqlite3")
+JOB_WORKERS = int(os.environ.get("QC_JOB_WORKERS", "4"))
+BATCH_POLL_INTERVAL = float(os.environ.get("QC_BATCH_POLL_INTERVAL", "30"))
+BATCH_MAX_REQUESTS = int(os.environ.get("QC_BATCH_MAX_REQUESTS", "10000"))
+
+Submission = Literal["realtime", "batch"]
+
+class JobStore:
+    def __init__(self, path: str):
+        self.path = path or ":memory:"
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                submission TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                batch_ids TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL)""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                PRIMARY KEY (job_id, idx))""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS job_items_status ON job_items (job_id, status)")
+            self._db.commit()
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def recover(self) -> None:
+        # Work that was in flight when the process stopped is picked up again
+        with self._lock:
+            db = self._connect()
+            db.execute("UPDATE job_items SET status = 'pending' WHERE status = 'running'")
+            db.execute("UPDATE jobs SET status = 'queued' WHERE submission = 'batch' AND status = 'running'")
+            db.commit()
+
+    def create(self, items: List[QuestionData], mode: CheckMode, submission: Submission) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute("INSERT INTO jobs (id, status, submission, mode, total, created, updated) "
+                       "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                       (job_id, submission, mode, len(items), now, now))
+            db.executemany("INSERT INTO job_items (job_id, idx, status, data) VALUES (?, ?, 'pending', ?)",
+                           [(job_id, idx, item.model_dump_json()) for idx, item in enumerate(items)])
+            db.commit()
+        return job_id
+
+    def claim_item(self) -> Optional[Tuple[str, int, QuestionData, str]]:
+        with self._lock:
+            db = self._connect()
+            # Jobs with the fewest items in flight go first, so a big job
+            # does not hold every worker while smaller ones wait
+            job = db.execute("""SELECT j.id, j.mode FROM jobs j
+                WHERE j.submission = 'realtime' AND j.status IN ('queued', 'running')
+                  AND EXISTS (SELECT 1 FROM job_items i WHERE i.job_id = j.id AND i.status = 'pending')
+                ORDER BY (SELECT COUNT(*) FROM job_items i WHERE i.job_id = j.id AND i.status = 'running'), j.created
+                LIMIT 1""").fetchone()
+            if job is None:
+                return None
+            idx, data = db.execute("SELECT idx, data FROM job_items WHERE job_id = ? AND status = 'pending' "
+                                   "ORDER BY idx LIMIT 1", (job[0],)).fetchone()
+            db.execute("UPDATE job_items SET status = 'running' WHERE job_id = ? AND idx = ?", (job[0], idx))
+            db.execute("UPDATE jobs SET status = 'running', updated = ? WHERE id = ?", (time.time(), job[0]))
+            db.commit()
+            return job[0], idx, QuestionData.model_validate_json(data), job[1]
+
+    def claim_batch_job(self) -> Optional[str]:
+        with self._lock:
+            db = self._connect()
+            row = db.execute("SELECT id FROM jobs WHERE submission = 'batch' AND status = 'queued' "
+                             "ORDER BY created LIMIT 1").fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET status = 'running', updated = ? WHERE id = ?", (time.time(), row[0]))
+            db.commit()
+            return row[0]
+
+    def job_items(self, job_id: str) -> List[Tuple[int, str, QuestionData, Optional[dict]]]:
+        with self._lock:
+            rows = self._connect().execute("SELECT idx, status, data, result FROM job_items WHERE job_id = ? "
+                                           "ORDER BY idx", (job_id,)).fetchall()
+        return [(idx, status, QuestionData.model_validate_json(data), json.loads(result) if result else None)
+                for idx, status, data, result in rows]
+
+    def job(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            db = self._connect()
+            row = db.execute("SELECT status, submission, mode, total, batch_ids, error, created, updated "
+                             "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status",
+                                     (job_id,)).fetchall())
+        status, submission, mode, total, batch_ids, error, created, updated = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "submission": submission,
+            "mode": mode,
+            "total": total,
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "pending": total - counts.get("done", 0) - counts.get("failed", 0),
+            "batch_ids": json.loads(batch_ids) if batch_ids else [],
+            "error": error,
+            "created": created,
+            "updated": updated,
+        }
+
+    def results(self, job_id: str, offset: int, limit: int) -> List[dict]:
+        with self._lock:
+            rows = self._connect().execute("SELECT idx, status, result, error FROM job_items WHERE job_id = ? "
+                                           "ORDER BY idx LIMIT ? OFFSET ?", (job_id, limit, offset)).fetchall()
+        return [{"index": idx, "status": status, "result": json.loads(result) if result else None, "error": error}
+                for idx, status, result, error in rows]
+
+    def save_item(self, job_id: str, idx: int, status: str, result: Optional[dict] = None,
+                  error: Optional[str] = None) -> None:
+        with self._lock:
+            db = self._connect()
+            db.execute("UPDATE job_items SET status = ?, result = ?, error = ? WHERE job_id = ? AND idx = ?",
+                       (status, json.dumps(result) if result is not None else None, error, job_id, idx))
+            unfinished = db.execute("SELECT COUNT(*) FROM job_items WHERE job_id = ? "
+                                    "AND status NOT IN ('done', 'failed')", (job_id,)).fetchone()[0]
+            db.execute("UPDATE jobs SET status = CASE WHEN ? = 0 THEN 'completed' ELSE status END, updated = ? "
+                       "WHERE id = ?", (unfinished, time.time(), job_id))
+            db.commit()
+
+    def set_batch_ids(self, job_id: str, batch_ids: List[str]) -> None:
+        with self._lock:
+            db = self._connect()
+            db.execute("UPDATE jobs SET batch_ids = ?, updated = ? WHERE id = ?",
+                       (json.dumps(batch_ids), time.time(), job_id))
+            db.commit()
+
+    def fail_job(self, job_id: str, error: str) -> None:
+        with self._lock:
+            db = self._connect()
+            db.execute("UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+                       (error, time.time(), job_id))
+            db.commit()
+
+job_store = JobStore(JOBS_PATH)
+
+async def submit_message_batch(requests: List[dict]) -> str:
+    response = await get_http_client().post(BATCH_API_URL, json={"requests": requests})
+    response.raise_for_status()
+    return response.json()["id"]
+
+async def wait_for_message_batch(batch_id: str) -> List[dict]:
+    client = get_http_client()
+    while True:
+        try:
+            response = await client.get(f"{BATCH_API_URL}/{batch_id}")
+            response.raise_for_status()
+            batch = response.json()
+            if batch["processing_status"] == "ended":
+                results = await client.get(batch["results_url"])
+                results.raise_for_status()
+                return [json.loads(line) for line in results.text.splitlines() if line.strip()]
+        except httpx.HTTPError as e:
+            log_event(logging.WARNING, "batch_poll_failed", batch_id=batch_id, error=str(e))
+        await asyncio.sleep(BATCH_POLL_INTERVAL)
+
+async def run_batch_job(job_id: str) -> None:
+    # Every uncached rubric prompt of the job goes upstream as one bulk
+    # submission; local verdicts and cache hits are stored up front
+    job = await asyncio.to_thread(job_store.job, job_id)
+    items = await asyncio.to_thread(job_store.job_items, job_id)
+
+    requests = []
+    keys: Dict[str, str] = {}
+    for idx, status, data, partial in items:
+        if status in ("done", "failed"):
+            continue
+        data, similar = await narrow_topic_questions(data)
+        data, passages = compact_article(data, ARTICLE_TOKEN_BUDGET)
+        decided, pending = split_by_rules(data, job["mode"])
+        result = partial or dict(decided, cache={}, attempts={})
+        if similar is not None:
+            result.setdefault("similar", {"topic": data.topic, "questions": similar})
+        if passages is not None:
+            used = [passage["index"] for passage in passages["passages"]]
+            result.setdefault("passages", dict(passages, rubrics={name: used for name in pending}))
+        for name, prompt in pending.items():
+            payload = build_payload(prompt)
+            key = cache_key(payload, prompt.get("context"))
+            result["cache"].setdefault(name, {"hit": False, "key": key})
+            if name in result:
+                continue
+            cached = await rubric_cache.get(key)
+            if cached is not None:
+                result[name] = await parse_call(RubricCall(cached, key, cache_hit=True), name)
+                result["cache"][name]["hit"] = True
+                continue
+            custom_id = f"{idx}-{name}"
+            keys[custom_id] = key
+            requests.append({"custom_id": custom_id, "params": payload})
+        await asyncio.to_thread(job_store.save_item, job_id, idx, "batch", result)
+
+    batch_ids = job["batch_ids"]
+    if not batch_ids and requests:
+        for start in range(0, len(requests), BATCH_MAX_REQUESTS):
+            batch_ids.append(await submit_message_batch(requests[start:start + BATCH_MAX_REQUESTS]))
+        await asyncio.to_thread(job_store.set_batch_ids, job_id, batch_ids)
+
+    results: Dict[str, RubricCall] = {}
+    for batch_id in batch_ids:
+        for entry in await wait_for_message_batch(batch_id):
+            custom_id = entry["custom_id"]
+            if custom_id not in keys:
+                continue
+            call = RubricCall(None, keys[custom_id], attempts=1)
+            if entry["result"]["type"] == "succeeded":
+                call.text = entry["result"]["message"]["content"][0]["text"]
+            else:
+                call.error = f"Batch request {entry['result']['type']}"
+            results[custom_id] = call
+
+    for idx, status, data, result in await asyncio.to_thread(job_store.job_items, job_id):
+        if status != "batch":
+            continue
+        names = data.rubrics or RUBRIC_NAMES
+        # Batch replies are repaired but not re-asked
+        parsing = {}
+        for name in names:
+            call = results.get(f"{idx}-{name}")
+            if call is not None:
+                result[name] = await parse_call(call, name)
+                result["attempts"][name] = {"attempts": call.attempts, "hedged": False}
+                parsing[name] = {"repaired": call.repaired, "reasked": False}
+            elif result.get(name) is None:
+                result[name] = {"error": "Missing from batch results"}
+        ordered = {name: result[name] for name in names}
+        ordered.update(cache=result["cache"], attempts=result["attempts"], parsing=parsing_report(parsing))
+        for extra in ("similar", "passages"):
+            if extra in result:
+                ordered[extra] = result[extra]
+        failed = failed_rubrics(ordered)
+        await asyncio.to_thread(job_store.save_item, job_id, idx, "failed" if failed else "done", ordered,
+                                f"Failed rubric(s): {', '.join(failed)}" if failed else None)
+
+class JobRunner:
+    def __init__(self, store: JobStore, workers: int):
+        self.store = store
+        self.workers = workers
+        self.wakeup = asyncio.Event()
+        self.tasks: List[asyncio.Task] = []
+        self.batch_tasks: Dict[str, asyncio.Task] = {}
+
+    async def start(self) -> None:
+        self.wakeup = asyncio.Event()
+        await asyncio.to_thread(self.store.recover)
+        self.tasks = [asyncio.ensure_future(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self.tasks + list(self.batch_tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self.tasks, *self.batch_tasks.values(), return_exceptions=True)
+        self.tasks = []
+        self.batch_tasks = {}
+        self.store.close()
+
+    def notify(self) -> None:
+        self.wakeup.set()
+
+    async def worker(self) -> None:
+        while True:
+            try:
+                batch_job = await asyncio.to_thread(self.store.claim_batch_job)
+                if batch_job is not None:
+                    # Batch jobs mostly wait on upstream, they get their own task
+                    self.batch_tasks[batch_job] = asyncio.ensure_future(self.run_batch(batch_job))
+                    continue
+
+                claimed = await asyncio.to_thread(self.store.claim_item)
+                if claimed is None:
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), timeout=1.0)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                job_id, idx, data, mode = claimed
+                current_lane.set(f"job-{job_id}")
+                try:
+                    result = await analyze(data, mode)
+                    failed = failed_rubrics(result)
+                    await asyncio.to_thread(self.store.save_item, job_id, idx, "failed" if failed else "done", result,
+                                            f"Failed rubric(s): {', '.join(failed)}" if failed else None)
+                except Exception as e:
+                    await asyncio.to_thread(self.store.save_item, job_id, idx, "failed", None, str(e))
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                result[f"prompt{i}"] = {"error": f"Failed to parse response: {str(e)}"}
-        
-        return result
-    
+                log_event(logging.ERROR, "job_worker_error", error=str(e))
+                await asyncio.sleep(1.0)
+
+    async def run_batch(self, job_id: str) -> None:
+        try:
+            await run_batch_job(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log_event(logging.ERROR, "batch_job_failed", job_id=job_id, error=str(e))
+            await asyncio.to_thread(self.store.fail_job, job_id, str(e))
+        finally:
+            self.batch_tasks.pop(job_id, None)
+
+job_runner = JobRunner(job_store, JOB_WORKERS)
+
+@app.post("/jobs")
+async def submit_job(items: List[QuestionData], mode: CheckMode = CHECK_MODE,
+                     submission: Submission = "realtime") -> dict:
+    try:
+        job_id = await asyncio.to_thread(job_store.create, items, mode, submission)
+        job_runner.notify()
+        return await asyncio.to_thread(job_store.job, job_id)
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> dict:
+    job = await asyncio.to_thread(job_store.job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str, offset: int = 0, limit: int = 50) -> dict:
+    job = await asyncio.to_thread(job_store.job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    limit = max(1, min(limit, 500))
+    results = await asyncio.to_thread(job_store.results, job_id, max(0, offset), limit)
+    return {"job_id": job_id, "status": job["status"], "total": job["total"],
+            "offset": offset, "limit": limit, "results": results}
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="AP multiple choice question QC")
+    commands = parser.add_subparsers(dest="command")
+
+    serve = commands.add_parser("serve", help="run the HTTP API (default)")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--api-url", help="upstream Messages API URL (default: QC_API_URL)")
+
+    bulk = commands.add_parser("qc", help="QC a JSONL file of QuestionData records")
+    bulk.add_argument("input", help="JSONL file with one QuestionData record per line")
+    bulk.add_argument("output", help="JSONL file results are appended to")
+    bulk.add_argument("--manifest", help="checkpoint of finished record ids (default: OUTPUT.manifest)")
+    bulk.add_argument("--errors", help="JSONL log of failed attempts, retried next run (default: OUTPUT.errors)")
+    bulk.add_argument("--concurrency", type=int, default=8, help="questions analysed at once")
+    bulk.add_argument("--mode", choices=["llm", "rules", "hybrid"], default=CHECK_MODE)
+    bulk.add_argument("--groups", default=RUBRIC_GROUPS,
+                      help='rubrics to consolidate into one call, e.g. "prompt7,prompt9,prompt10;prompt3,prompt4"')
+    bulk.add_argument("--gating", action=argparse.BooleanOptionalAction, default=GATING,
+                      help="skip gated rubrics when clarity or format scored 0")
+    bulk.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    bulk.add_argument("--api-url", help="upstream Messages API URL (default: QC_API_URL)")
+
+    args = parser.parse_args(argv)
+    if getattr(args, "api_url", None):
+        set_api_url(args.api_url)
+    if args.command == "qc":
+        try:
+            groups = parse_rubric_groups(args.groups)
+        except ValueError as e:
+            parser.error(str(e))
+        asyncio.run(run_bulk_qc(args.input, args.output, args.manifest or args.output + ".manifest",
+                                args.errors or args.output + ".errors", args.concurrency, args.mode, groups,
+                                args.gating, args.progress_interval))
+    else:
+        import uvicorn
+        uvicorn.run(app, host=getattr(args, "host", "0.0.0.0"), port=getattr(args, "port", 8000))
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    main()
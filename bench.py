@@ -0,0 +1,303 @@
+# Local mock of the upstream API and a load generator for the QC app; kept
+# out of ap-mcq-qc.py so the API workers never import them
+import argparse
+import asyncio
+import importlib.util
+import json
+import math
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Literal
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request, Response
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ap-mcq-qc.py")
+
+def load_app_module():
+    # The app file name is not a valid module name; reuse it if already loaded
+    module = sys.modules.get("ap_mcq_qc")
+    if module is None:
+        spec = importlib.util.spec_from_file_location("ap_mcq_qc", APP_PATH)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["ap_mcq_qc"] = module
+        spec.loader.exec_module(module)
+    return module
+
+load_app_module()
+from ap_mcq_qc import (ARTICLE_TOKEN_BUDGET, CHECK_MODE, GATING, MODEL, RUBRIC_GROUPS, RUBRICS, UPSTREAM_REQUESTS,
+                       CheckMode, QuestionData, app, close_http_client, estimate_tokens, get_http_client,
+                       parse_rubric_groups, set_api_url)
+
+# Local stand-in for the Anthropic Messages and Message Batches APIs
+@dataclass
+class MockProfile:
+    # Median latency, spread (lognormal sigma or uniform +/- fraction) and the
+    # share of calls answered with a 500/529 or a 429
+    latency_ms: float = 0.0
+    latency_dist: Literal["fixed", "uniform", "lognormal"] = "fixed"
+    latency_spread: float = 0.5
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    seed: Optional[int] = None
+
+    def latency(self, rng: random.Random) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        if self.latency_dist == "uniform":
+            spread = min(self.latency_spread, 1.0)
+            return rng.uniform(self.latency_ms * (1 - spread), self.latency_ms * (1 + spread)) / 1000
+        if self.latency_dist == "lognormal":
+            return rng.lognormvariate(math.log(self.latency_ms), self.latency_spread) / 1000
+        return self.latency_ms / 1000
+
+    def failure(self, rng: random.Random) -> Optional[int]:
+        roll = rng.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return rng.choice((500, 529))
+        return None
+
+MOCK_ERROR_TYPES = {429: "rate_limit_error", 500: "api_error", 529: "overloaded_error"}
+
+def mock_rubric_reply(prompt: str) -> dict:
+    if "ek_aligned" in prompt:
+        return {"score": 1, "rationale": "Mock rationale.", "ek_aligned": "EK", "lo_aligned": "LO",
+                "skill_aligned": "1"}
+    if "questiontype" in prompt:
+        return {"score": 1, "rationale": "Mock rationale.", "difficulty": "2", "questiontype": "analyze"}
+    return {"score": 1, "rationale": "Mock rationale.", "feedback": "Mock feedback."}
+
+def mock_reply(payload: dict) -> str:
+    prompt = payload["messages"][-1]["content"]
+    # Consolidated calls get one object per rubric section
+    sections = re.split(r'^Rubric "(prompt\d+)":$', prompt, flags=re.MULTILINE)
+    if len(sections) > 1:
+        return json.dumps([{"rubric": name, **mock_rubric_reply(section)}
+                           for name, section in zip(sections[1::2], sections[2::2])])
+    return json.dumps(mock_rubric_reply(prompt))
+
+def mock_message(payload: dict) -> dict:
+    return {
+        "id": f"msg_{uuid.uuid4().hex}",
+        "type": "message",
+        "role": "assistant",
+        "model": payload.get("model", MODEL),
+        "content": [{"type": "text", "text": mock_reply(payload)}],
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": estimate_tokens(payload), "output_tokens": 60},
+    }
+
+def create_mock_app(batch_delay: float = 2.0, profile: Optional[MockProfile] = None) -> FastAPI:
+    mock = FastAPI(title="Mock Anthropic API")
+    batches: Dict[str, dict] = {}
+    profile = profile or MockProfile()
+    rng = random.Random(profile.seed)
+
+    @mock.post("/v1/messages")
+    async def messages(payload: dict) -> Response:
+        await asyncio.sleep(profile.latency(rng))
+        status = profile.failure(rng)
+        if status is not None:
+            error = {"type": "error", "error": {"type": MOCK_ERROR_TYPES[status], "message": "Injected by mock"}}
+            headers = {"retry-after": f"{profile.retry_after:g}"} if status == 429 else None
+            return Response(json.dumps(error), status_code=status, media_type="application/json", headers=headers)
+        return Response(json.dumps(mock_message(payload)), media_type="application/json")
+
+    @mock.post("/v1/messages/batches")
+    async def create_batch(body: dict) -> dict:
+        batch_id = f"msgbatch_{uuid.uuid4().hex}"
+        batches[batch_id] = {"requests": body["requests"], "ends_at": time.time() + batch_delay}
+        return {"id": batch_id, "type": "message_batch", "processing_status": "in_progress"}
+
+    @mock.get("/v1/messages/batches/{batch_id}")
+    async def get_batch(batch_id: str, request: Request) -> dict:
+        batch = batches.get(batch_id)
+        if batch is None:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        ended = time.time() >= batch["ends_at"]
+        return {"id": batch_id, "type": "message_batch",
+                "processing_status": "ended" if ended else "in_progress",
+                "results_url": str(request.url_for("batch_results", batch_id=batch_id)) if ended else None}
+
+    @mock.get("/v1/messages/batches/{batch_id}/results", name="batch_results")
+    async def batch_results(batch_id: str) -> Response:
+        batch = batches.get(batch_id)
+        if batch is None:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        lines = [json.dumps({"custom_id": request["custom_id"],
+                             "result": {"type": "errored", "error": {"type": "api_error"}}
+                             if profile.failure(rng) is not None else
+                             {"type": "succeeded", "message": mock_message(request["params"])}})
+                 for request in batch["requests"]]
+        return Response("\n".join(lines) + "\n", media_type="application/x-jsonl")
+
+    return mock
+
+# Load test: drives the app in-process at fixed concurrency levels
+BENCH_TOPICS = ["tariffs", "monetary policy", "comparative advantage", "price ceilings", "externalities",
+                "elasticity", "market structure", "fiscal multipliers", "labor markets", "exchange rates"]
+
+def synthetic_question(index: int, run_id: str) -> QuestionData:
+    # Unique per run so results never come from an earlier run's cache
+    topic = BENCH_TOPICS[index % len(BENCH_TOPICS)]
+    options = [f"{topic.capitalize()} effect {index}-{letter}" for letter in "ABCD"]
+    return QuestionData(
+        article=f"An introductory reading on {topic}. " * 40,
+        topic_questions=f"Which statement best describes {topic}?\nWhat is a common misconception about {topic}?",
+        difficulty_level=index % 3 + 1,
+        question=f"[{run_id}-{index}] Which outcome best explains the role of {topic} in the passage?",
+        responses="\n".join(f"{letter}. {option}" for letter, option in zip("ABCD", options)),
+        correct=options[0],
+        distractors="\n".join(options[1:]),
+        explanations=f"The passage links {topic} to the first outcome.",
+        ek_description=f"EK on {topic}",
+        lo_description=f"LO on {topic}",
+        goodqs="Which statement best describes supply?",
+        badqs="Supply is what?",
+    )
+
+def percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))] if ordered else 0.0
+
+def upstream_call_counts() -> Dict[str, float]:
+    counts: Dict[str, float] = {}
+    for (_, _, status), value in UPSTREAM_REQUESTS.values.items():
+        counts[status] = counts.get(status, 0.0) + value
+    return counts
+
+async def run_benchmark_level(client: httpx.AsyncClient, concurrency: int, questions: int, run_id: str,
+                              params: Dict[str, str]) -> dict:
+    items = iter(range(questions))
+    latencies: List[float] = []
+    failed = 0
+    rubric_errors = 0
+
+    async def worker() -> None:
+        nonlocal failed, rubric_errors
+        for index in items:
+            data = synthetic_question(index, f"{run_id}-c{concurrency}")
+            started = time.monotonic()
+            response = await client.post("/analyze-question", params=params, content=data.model_dump_json(),
+                                         headers={"content-type": "application/json"})
+            latencies.append(time.monotonic() - started)
+            if response.status_code != 200:
+                failed += 1
+                continue
+            rubric_errors += sum(isinstance(value, dict) and "error" in value
+                                 for name, value in response.json().items() if name in RUBRICS)
+
+    before = upstream_call_counts()
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    after = upstream_call_counts()
+    statuses = {status: int(count - before.get(status, 0.0)) for status, count in after.items()
+                if count > before.get(status, 0.0)}
+
+    return {
+        "concurrency": concurrency,
+        "questions": questions,
+        "failed_questions": failed,
+        "rubric_errors": rubric_errors,
+        "seconds": round(elapsed, 3),
+        "questions_per_second": round(questions / elapsed, 3) if elapsed else None,
+        "latency_ms": {name: round(value * 1000, 1) for name, value in (
+            ("p50", percentile(latencies, 50)), ("p95", percentile(latencies, 95)),
+            ("p99", percentile(latencies, 99)), ("max", max(latencies, default=0.0)))},
+        "upstream_calls_per_question": round(sum(statuses.values()) / questions, 3) if questions else None,
+        "upstream_statuses": statuses,
+    }
+
+async def run_benchmark(levels: List[int], questions: int, mode: CheckMode, groups: str, gating: bool,
+                        article_budget: int, api_url: Optional[str], profile: MockProfile, output_path: str,
+                        label: str) -> dict:
+    if api_url:
+        set_api_url(api_url)
+    else:
+        set_api_url("http://mock/v1/messages")
+        await close_http_client()
+        get_http_client(httpx.ASGITransport(app=create_mock_app(profile=profile)))
+
+    run_id = uuid.uuid4().hex[:8]
+    params = {"mode": mode, "groups": groups, "gating": str(gating).lower(), "article_budget": str(article_budget)}
+    report = {"label": label, "created": time.time(), "model": MODEL, "mode": mode, "groups": groups,
+              "gating": gating, "article_budget": article_budget, "upstream": api_url or "in-process mock",
+              "mock": None if api_url else vars(profile), "levels": []}
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://qc",
+                                     timeout=None) as client:
+            for concurrency in levels:
+                level = await run_benchmark_level(client, concurrency, questions, run_id, params)
+                report["levels"].append(level)
+                print(f"[bench] concurrency {concurrency}: {level['questions_per_second']} q/s, "
+                      f"p50 {level['latency_ms']['p50']}ms, p95 {level['latency_ms']['p95']}ms, "
+                      f"p99 {level['latency_ms']['p99']}ms, "
+                      f"{level['upstream_calls_per_question']} upstream calls/q", file=sys.stderr)
+    finally:
+        await close_http_client()
+
+    with open(output_path, "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2)
+    return report
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="median mock upstream latency")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="fixed")
+    parser.add_argument("--latency-spread", type=float, default=0.5,
+                        help="lognormal sigma, or +/- fraction for uniform")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered 500/529")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of calls answered 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="retry-after sent with injected 429s")
+    parser.add_argument("--seed", type=int, help="seed for reproducible latencies and failures")
+
+def mock_profile(args: argparse.Namespace) -> MockProfile:
+    return MockProfile(args.latency_ms, args.latency_dist, args.latency_spread, args.error_rate,
+                       args.rate_limit_rate, args.retry_after, args.seed)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Mock upstream and load test for the AP QC API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    mock = commands.add_parser("mock", help="run a local mock of the upstream Messages API")
+    mock.add_argument("--host", default="127.0.0.1")
+    mock.add_argument("--port", type=int, default=8001)
+    mock.add_argument("--batch-delay", type=float, default=2.0, help="seconds before a mock batch ends")
+    add_mock_arguments(mock)
+
+    bench = commands.add_parser("bench", help="load test /analyze-question against a mock upstream")
+    bench.add_argument("--concurrency", default="1,4,16", help="comma separated concurrency levels")
+    bench.add_argument("--questions", type=int, default=50, help="questions per concurrency level")
+    bench.add_argument("--mode", choices=["llm", "rules", "hybrid"], default=CHECK_MODE)
+    bench.add_argument("--groups", default=RUBRIC_GROUPS, help="rubric groups, as for qc")
+    bench.add_argument("--gating", action=argparse.BooleanOptionalAction, default=GATING)
+    bench.add_argument("--article-budget", type=int, default=ARTICLE_TOKEN_BUDGET,
+                       help="article token budget, 0 sends the whole article")
+    bench.add_argument("--api-url", help="benchmark against this upstream instead of an in-process mock")
+    bench.add_argument("--output", default="bench_report.json", help="JSON report path")
+    bench.add_argument("--label", default="", help="name for this run in the report, e.g. a git revision")
+    add_mock_arguments(bench)
+
+    args = parser.parse_args(argv)
+    if args.command == "mock":
+        import uvicorn
+        uvicorn.run(create_mock_app(args.batch_delay, mock_profile(args)), host=args.host, port=args.port)
+    else:
+        try:
+            levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+            parse_rubric_groups(args.groups)
+        except ValueError as e:
+            parser.error(str(e))
+        asyncio.run(run_benchmark(levels, args.questions, args.mode, args.groups, args.gating, args.article_budget,
+                                  args.api_url, mock_profile(args), args.output, args.label))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import importlib.util
+import os
+import pathlib
+import sys
+
+import pytest
+
+MODULE_PATH = pathlib.Path(__file__).resolve().parent.parent / "ap-mcq-qc.py"
+BENCH_PATH = MODULE_PATH.with_name("bench.py")
+
+
+@pytest.fixture(scope="session")
+def qc():
+    # Keep every store in memory and the admission limits out of the way
+    os.environ.update(QC_CACHE_PATH="", QC_JOBS_PATH="", QC_TOPIC_INDEX_PATH="", QC_LOG_LEVEL="ERROR",
+                      QC_REQUESTS_PER_MINUTE="1000000", QC_TOKENS_PER_MINUTE="1000000000")
+    spec = importlib.util.spec_from_file_location("ap_mcq_qc", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["ap_mcq_qc"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def bench(qc):
+    # The mock upstream lives beside the app and reuses the module loaded above
+    spec = importlib.util.spec_from_file_location("bench", BENCH_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def question():
+    return dict(article="An article.", topic_questions="Which is it?", difficulty_level=2, question="Q?",
+                responses="A. x\nB. y\nC. z\nD. w", correct="x", distractors="y\nz\nw", explanations="e",
+                ek_description="ek", lo_description="lo", goodqs="g", badqs="b")
@@ -0,0 +1,39 @@
+import asyncio
+import json
+
+import httpx
+
+
+def test_rerun_appends_one_output_line_per_id(qc, bench, question, tmp_path, monkeypatch):
+    monkeypatch.setattr(qc, "MAX_ATTEMPTS", 1)
+    qc.rubric_cache.memory.clear()
+    qc.set_api_url("http://mock/v1/messages")
+    input_path = tmp_path / "items.jsonl"
+    input_path.write_text("".join(json.dumps(dict(question, id=f"q{i}", question=f"Q{i}?")) + "\n"
+                                  for i in range(3)))
+    paths = [str(tmp_path / name) for name in ("out.jsonl", "out.jsonl.manifest", "out.jsonl.errors")]
+    upstream_down = {"Q1?"}
+
+    async def handler(request):
+        payload = json.loads(request.content)
+        if any(question in payload["messages"][0]["content"] for question in upstream_down):
+            return httpx.Response(503)
+        return httpx.Response(200, json={"content": [{"type": "text", "text": bench.mock_reply(payload)}],
+                                         "usage": {}})
+
+    def run():
+        qc.http_client = None
+        qc.get_http_client(httpx.MockTransport(handler))
+        asyncio.run(qc.run_bulk_qc(str(input_path), *paths, 2, "llm", [], False, 60.0))
+
+    run()
+    output, manifest, errors = paths
+    assert sorted(json.loads(line)["id"] for line in open(output)) == ["q0", "q2"]
+    assert [json.loads(line)["id"] for line in open(errors)] == ["q1"]
+
+    upstream_down.clear()
+    run()
+    lines = [json.loads(line) for line in open(output)]
+    assert sorted(line["id"] for line in lines) == ["q0", "q1", "q2"]
+    assert all(not qc.failed_rubrics(line["result"]) for line in lines)
+    assert sorted(open(manifest).read().split()) == ["q0", "q1", "q2"]
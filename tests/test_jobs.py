@@ -0,0 +1,119 @@
+import asyncio
+
+import httpx
+import pytest
+
+
+@pytest.fixture
+def jobs(qc, tmp_path, monkeypatch):
+    # A fresh store and runner per test, with upstream served by the local mock
+    store = qc.JobStore(str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(qc, "job_store", store)
+    monkeypatch.setattr(qc, "job_runner", qc.JobRunner(store, 2))
+    monkeypatch.setattr(qc, "BATCH_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(qc, "MAX_ATTEMPTS", 1)
+    qc.rubric_cache.memory.clear()
+    qc.set_api_url("http://mock/v1/messages")
+    qc.http_client = None
+    return store
+
+
+def use_upstream(qc, transport):
+    qc.http_client = None
+    qc.get_http_client(transport)
+
+
+async def wait_for_job(client, job_id, timeout=10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in ("completed", "failed") or asyncio.get_running_loop().time() > deadline:
+            return job
+        await asyncio.sleep(0.05)
+
+
+def run_with_app(qc, scenario):
+    async def main():
+        await qc.job_runner.start()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=qc.app), base_url="http://qc") as client:
+                return await scenario(client)
+        finally:
+            await qc.job_runner.stop()
+            await qc.close_http_client()
+
+    return asyncio.run(main())
+
+
+def test_realtime_job_submit_poll_and_paginate(qc, bench, jobs, question):
+    use_upstream(qc, httpx.ASGITransport(app=bench.create_mock_app()))
+
+    async def scenario(client):
+        submitted = (await client.post("/jobs?mode=llm",
+                                       json=[dict(question, question=f"Q{i}?") for i in range(3)])).json()
+        assert submitted["total"] == 3
+        job = await wait_for_job(client, submitted["job_id"])
+        page = (await client.get(f"/jobs/{submitted['job_id']}/results?offset=1&limit=1")).json()
+        missing = await client.get("/jobs/unknown")
+        return job, page, missing
+
+    job, page, missing = run_with_app(qc, scenario)
+    assert job["status"] == "completed"
+    assert (job["done"], job["failed"], job["pending"]) == (3, 0, 0)
+    assert [result["index"] for result in page["results"]] == [1]
+    assert page["results"][0]["status"] == "done"
+    assert page["results"][0]["result"]["prompt1"]["score"] == 1
+    assert missing.status_code == 404
+
+
+def test_realtime_job_items_with_failed_rubrics_are_failed(qc, jobs, question):
+    use_upstream(qc, httpx.MockTransport(lambda request: httpx.Response(503)))
+
+    async def scenario(client):
+        submitted = (await client.post("/jobs?mode=llm", json=[question, dict(question, question="Q2?")])).json()
+        job = await wait_for_job(client, submitted["job_id"])
+        page = (await client.get(f"/jobs/{submitted['job_id']}/results")).json()
+        return job, page
+
+    job, page = run_with_app(qc, scenario)
+    assert job["status"] == "completed"
+    assert (job["done"], job["failed"]) == (0, 2)
+    assert all(result["status"] == "failed" for result in page["results"])
+    assert "prompt1" in page["results"][0]["error"]
+
+
+def test_batch_job_goes_through_message_batches(qc, bench, jobs, question):
+    use_upstream(qc, httpx.ASGITransport(app=bench.create_mock_app(batch_delay=0.2)))
+
+    async def scenario(client):
+        submitted = (await client.post("/jobs?mode=llm&submission=batch",
+                                       json=[dict(question, question=f"B{i}?") for i in range(2)])).json()
+        job = await wait_for_job(client, submitted["job_id"])
+        page = (await client.get(f"/jobs/{submitted['job_id']}/results")).json()
+        return job, page
+
+    job, page = run_with_app(qc, scenario)
+    assert job["status"] == "completed"
+    assert job["done"] == 2 and len(job["batch_ids"]) == 1
+    for result in page["results"]:
+        assert result["result"]["prompt4"]["ek_aligned"] == "EK"
+        assert result["result"]["prompt5"]["difficulty"] == "2"
+
+
+def test_recover_requeues_work_in_flight(qc, tmp_path, question):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = qc.JobStore(path)
+    items = [qc.QuestionData(**question), qc.QuestionData(**dict(question, question="Q2?"))]
+    realtime = store.create(items, "llm", "realtime")
+    batch = store.create(items, "llm", "batch")
+    assert store.claim_item()[:2] == (realtime, 0)
+    assert store.claim_batch_job() == batch
+    store.close()
+
+    # As if the process had stopped with both jobs in flight
+    restarted = qc.JobStore(path)
+    restarted.recover()
+    assert restarted.job(batch)["status"] == "queued"
+    assert [restarted.claim_item()[1], restarted.claim_item()[1]] == [0, 1]
+    assert restarted.claim_batch_job() == batch
+    restarted.close()
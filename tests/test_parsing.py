@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+REPLY = {"score": 0, "rationale": "r", "feedback": "f"}
+
+
+@pytest.mark.parametrize("text, repaired", [
+    ('{"score": 0, "rationale": "r", "feedback": "f"}', False),
+    ('```json\n{"score": 0, "rationale": "r", "feedback": "f"}\n```', True),
+    ('Here is my evaluation:\n{"score": 0, "rationale": "r", "feedback": "f"}\nThanks.', True),
+    ('Note (see {x}): {"score": 0, "rationale": "r", "feedback": "f"}', True),
+    ('{"score": 0 "rationale": "r" "feedback": "f"}', True),
+    ('{"score": 0, "rationale": "r", "feedback": "f",}', True),
+    ("{'score': 0, 'rationale': 'r', 'feedback': 'f'}", True),
+    ('{"score": 0, "rationale": "r", "feedback": "f"', True),
+])
+def test_load_json_reply_recovers_rubric_object(qc, text, repaired):
+    assert qc.load_json_reply(text) == (REPLY, repaired)
+
+
+def test_load_json_reply_converts_python_literals(qc):
+    value, repaired = qc.load_json_reply("{'score': 1, 'ok': True, 'bad': False, 'extra': None}")
+    assert value == {"score": 1, "ok": True, "bad": False, "extra": None}
+    assert repaired
+
+
+def test_load_json_reply_closes_truncated_string(qc):
+    value, _ = qc.load_json_reply('{"score": 1, "rationale": "r", "feedback": "cut off')
+    assert value == {"score": 1, "rationale": "r", "feedback": "cut off"}
+
+
+def test_load_json_reply_repairs_outer_object_not_nested_one(qc):
+    value, _ = qc.load_json_reply('{"score":0,"rationale":"r","detail":{"a":1} "feedback":"f"}')
+    assert value == {"score": 0, "rationale": "r", "detail": {"a": 1}, "feedback": "f"}
+
+
+@pytest.mark.parametrize("text", [
+    '[{"rubric": "prompt7", "score": 1} {"rubric": "prompt9", "score": 0}]',
+    '[{"rubric": "prompt7", "score": 1}, {"rubric": "prompt9", "score": 0},]',
+    '[{"rubric": "prompt7", "score": 1}, {"rubric": "prompt9", "score": 0',
+    '```json\n[{"rubric": "prompt7", "score": 1}, {"rubric": "prompt9", "score": 0},]\n```',
+])
+def test_load_json_reply_repairs_malformed_array(qc, text):
+    value, repaired = qc.load_json_reply(text)
+    assert value == [{"rubric": "prompt7", "score": 1}, {"rubric": "prompt9", "score": 0}]
+    assert repaired
+
+
+def test_load_json_reply_rejects_prose(qc):
+    with pytest.raises(ValueError):
+        qc.load_json_reply("I cannot evaluate this question.")
+
+
+def test_parse_group_call_repairs_trailing_comma(qc):
+    text = ('[{"rubric": "prompt7", "score": 1, "rationale": "r", "feedback": "f"}, '
+            '{"rubric": "prompt9", "score": 0, "rationale": "r", "feedback": "f"},]')
+    call = qc.RubricCall(text, "key", cache_hit=True)
+    results = asyncio.run(qc.parse_group_call(call, ["prompt7", "prompt9"]))
+    assert results == {"prompt7": dict(REPLY, score=1), "prompt9": REPLY}
+    assert call.repaired
+
+
+def test_parse_call_reports_schema_errors(qc):
+    call = qc.RubricCall('{"score": 3, "rationale": "r", "feedback": "f"}', "key", cache_hit=True)
+    assert "error" in asyncio.run(qc.parse_call(call, "prompt1"))
+
+
+def test_reask_does_not_hold_back_other_rubrics(qc, bench, question, monkeypatch):
+    monkeypatch.setattr(qc, "MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(qc, "HEDGE_ENABLED", False)
+    qc.rubric_cache.memory.clear()
+    qc.set_api_url("http://mock/v1/messages")
+
+    async def handler(request):
+        payload = json.loads(request.content)
+        reasking = len(payload["messages"]) > 1
+        first = payload["messages"][0]["content"]
+        if "evaluate the clarity" in first:
+            # prompt1 replies with prose first and answers the re-ask slowly
+            await asyncio.sleep(0.5 if reasking else 0.01)
+            text = bench.mock_reply(dict(payload, messages=payload["messages"][:1])) if reasking else "Looks fine."
+        else:
+            await asyncio.sleep(0.01)
+            text = bench.mock_reply(payload)
+        return httpx.Response(200, json={"content": [{"type": "text", "text": text}], "usage": {}})
+
+    async def main():
+        qc.http_client = None
+        qc.get_http_client(httpx.MockTransport(handler))
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        arrived = {}
+        try:
+            async for name, value in qc.iter_analysis(qc.QuestionData(**question), "llm", [], False):
+                if name in qc.RUBRICS:
+                    arrived[name] = (loop.time() - started, value)
+        finally:
+            await qc.close_http_client()
+        return arrived
+
+    arrived = asyncio.run(main())
+    assert "error" not in arrived["prompt1"][1]
+    assert arrived["prompt1"][0] >= 0.5
+    assert all(seconds < 0.4 for name, (seconds, _) in arrived.items() if name != "prompt1")
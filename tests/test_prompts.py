@@ -0,0 +1,49 @@
+import asyncio
+import json
+
+import httpx
+
+
+def test_every_rubric_shares_the_cacheable_prefix(qc, bench, question, monkeypatch):
+    monkeypatch.setattr(qc, "MAX_ATTEMPTS", 1)
+    qc.rubric_cache.memory.clear()
+    qc.set_api_url("http://mock/v1/messages")
+    article = "The Treaty of Westphalia ended the Thirty Years War in 1648."
+    received = []
+
+    async def handler(request):
+        payload = json.loads(request.content)
+        received.append(payload)
+        return httpx.Response(200, json={"content": [{"type": "text", "text": bench.mock_reply(payload)}],
+                                         "usage": {}})
+
+    async def main():
+        qc.http_client = None
+        qc.get_http_client(httpx.MockTransport(handler))
+        try:
+            return await qc.analyze(qc.QuestionData(**dict(question, article=article)), "llm", [], False)
+        finally:
+            await qc.close_http_client()
+
+    result = asyncio.run(main())
+    assert not qc.failed_rubrics(result)
+    assert len(received) == len(qc.RUBRIC_NAMES)
+    system = received[0]["system"]
+    assert len(system) == 2
+    assert all(block["cache_control"] == {"type": "ephemeral"} for block in system)
+    assert all(payload["system"] == system for payload in received)
+    assert all(json.dumps(payload).count(article) == 1 for payload in received)
+
+
+def test_editing_a_context_field_only_invalidates_rubrics_that_read_it(qc, question):
+    def keys(**fields):
+        prompts = qc.generate_prompts(qc.QuestionData(**dict(question, **fields)))
+        return {name: qc.cache_key(qc.build_payload(prompt), prompt["context"]) for name, prompt in prompts.items()}
+
+    before = keys()
+    for field, rubrics in [("goodqs", {"prompt7", "prompt9", "prompt10"}),
+                           ("ek_description", {"prompt3", "prompt4"}),
+                           ("topic_questions", {"prompt3"}),
+                           ("article", {"prompt1", "prompt3", "prompt4", "prompt5"})]:
+        after = keys(**{field: question[field] + " edited"})
+        assert {name for name in before if before[name] != after[name]} == rubrics
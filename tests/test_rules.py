@@ -0,0 +1,86 @@
+import pytest
+
+
+def data(qc, question, **fields):
+    return qc.QuestionData(**dict(question, **fields))
+
+
+def test_phrase_matcher_matches_whole_words_only(qc):
+    matcher = qc.PhraseMatcher(["all", "no significant impact"])
+    assert matcher.find("The tall wall fell") == []
+    assert matcher.find("All of the above") == ["all"]
+    assert matcher.find("It had NO  significant\nimpact, at all.") == ["no significant impact", "all"]
+
+
+def test_phrase_list_normalises_phrases(qc):
+    assert qc.phrase_list(" All,always ,  no  Significant impact,,all") == ["all", "always", "no significant impact"]
+
+
+@pytest.mark.parametrize("text, options", [
+    ("A. one\nB. two\nC. three\nD. four", ["one", "two", "three", "four"]),
+    ("(A) one (B) two (C) three (D) four", ["one", "two", "three", "four"]),
+    ('["one", "two", " three "]', ["one", "two", "three"]),
+    ("one\ntwo\nthree", ["one", "two", "three"]),
+    ("A. the first option\n   wraps onto a second line\nB. two\nC. three\nD. four",
+     ["the first option wraps onto a second line", "two", "three", "four"]),
+])
+def test_split_options(qc, text, options):
+    assert qc.split_options(text) == options
+
+
+def test_option_count(qc, question):
+    assert qc.check_option_count(data(qc, question))["score"] == 1
+    assert qc.check_option_count(data(qc, question, responses="A. x\nB. y\nC. z"))["score"] == 0
+    # A single unlabelled line is not a layout the check understands
+    assert qc.check_option_count(data(qc, question, responses="x or y")) is None
+
+
+def test_distractor_length(qc, question):
+    assert qc.check_distractor_length(data(qc, question))["score"] == 1
+    long = data(qc, question, responses="A. x\nB. y\nC. z\nD. a much longer distractor",
+                distractors="y\nz\na much longer distractor")
+    assert qc.check_distractor_length(long)["score"] == 0
+
+
+@pytest.mark.parametrize("fields", [
+    {"distractors": "y\nz"},
+    {"correct": "x\ny"},
+])
+def test_distractor_length_abstains_when_split_is_incomplete(qc, question, fields):
+    assert qc.check_distractor_length(data(qc, question, **fields)) is None
+
+
+def test_absolutes(qc, question):
+    assert qc.check_absolutes(data(qc, question))["score"] == 1
+    absolute = data(qc, question, responses="A. always x\nB. never y\nC. z\nD. w", distractors="never y\nz\nw")
+    assert qc.check_absolutes(absolute)["score"] == 0
+    pattern = data(qc, question, distractors="y had minimal impact\nz\nw")
+    assert "minimal impact" in qc.check_absolutes(pattern)["rationale"]
+
+
+def test_comma_counts(qc, question):
+    assert qc.check_comma_counts(data(qc, question))["score"] == 1
+    assert qc.check_comma_counts(data(qc, question, responses="A. x, y\nB. y\nC. z\nD. w"))["score"] == 0
+    assert qc.check_comma_counts(data(qc, question, responses="x, y")) is None
+
+
+def test_rules_mode_only_finalises_rule_only_rubrics(qc, question):
+    decided, pending = qc.split_by_rules(data(qc, question), "rules")
+    assert pending == {}
+    assert decided["prompt8"]["score"] == 1
+    for name in ("prompt2", "prompt7", "prompt9"):
+        assert "score" not in decided[name]
+        assert decided[name]["rules"]["score"] == 1
+    assert "skipped" in decided["prompt1"]
+
+
+def test_rules_mode_keeps_failed_checks(qc, question):
+    decided, _ = qc.split_by_rules(data(qc, question, responses="A. x\nB. y\nC. z"), "rules")
+    assert decided["prompt2"]["score"] == 0
+
+
+def test_hybrid_mode_drops_verified_conditions(qc, question):
+    decided, pending = qc.split_by_rules(data(qc, question), "hybrid")
+    assert set(decided) == {"prompt8"}
+    assert qc.RULE_CONDITIONS["prompt2"] not in pending["prompt2"]["content"]
+    assert "Already verified locally" in pending["prompt2"]["content"]